@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+# Preço por mensagem usado no card "Valor Total Gasto"
+PRECO_CANAL_KPI = {'SMS': 0.048, 'RCS': 0.105}
+
+
+def _acumular(dias, valores, origem, tamanho):
+    # Soma por dia (bincount) e soma acumulada com um zero na frente:
+    # acumulado[i] = total dos dias [origem, origem + i)
+    validos = ~np.isnat(dias)
+    posicoes = (dias[validos] - origem).astype('int64')
+    por_dia = np.bincount(posicoes, weights=np.asarray(valores, dtype='float64')[validos], minlength=tamanho)
+    return np.concatenate([[0.0], np.cumsum(por_dia)])
+
+
+class IndiceDiario:
+    """Somas acumuladas por dia das medidas dos KPIs para uma seleção de filtros.
+
+    Montado uma vez por seleção (sem o intervalo de datas) a partir das células dos
+    cubos; o total de qualquer intervalo é a diferença de duas posições, então o
+    período escolhido e o período anterior de mesmo tamanho saem em O(1).
+    """
+
+    def __init__(self, origem, acumulados):
+        self.origem = origem
+        self.acumulados = acumulados
+        self.tamanho = len(next(iter(acumulados.values()))) - 1
+
+    def _posicao(self, data):
+        # Dias desde a origem, limitado às posições do acumulado
+        posicao = int((np.datetime64(data, 'D') - self.origem).astype('int64'))
+        return min(max(posicao, 0), self.tamanho)
+
+    def total(self, medida, inicio, fim):
+        # Intervalo fechado [inicio, fim]
+        esquerda = self._posicao(inicio)
+        direita = self._posicao(np.datetime64(fim, 'D') + 1)
+        if direita <= esquerda:
+            return 0.0
+        acumulado = self.acumulados[medida]
+        return float(acumulado[direita] - acumulado[esquerda])
+
+    def memory_usage(self, deep=True):
+        # Para o CacheLRU medir o índice como mede os DataFrames
+        return sum(acumulado.nbytes for acumulado in self.acumulados.values())
+
+    def totais(self, inicio, fim):
+        return {medida: self.total(medida, inicio, fim) for medida in self.acumulados}
+
+
+def periodo_anterior(inicio, fim):
+    # Mesmo número de dias corridos, terminando na véspera do início
+    dias = (fim - inicio).days + 1
+    return inicio - pd.Timedelta(days=dias), inicio - pd.Timedelta(days=1)
+
+
+def montar_indice_diario(celulas, celulas_gasto):
+    dias_hubspot = celulas['data'].to_numpy(dtype='datetime64[D]')
+    dias_gasto = celulas_gasto['data'].to_numpy(dtype='datetime64[D]')
+    todos = np.concatenate([dias_hubspot, dias_gasto])
+    todos = todos[~np.isnat(todos)]
+    if len(todos) == 0:
+        origem, tamanho = np.datetime64('1970-01-01', 'D'), 0
+    else:
+        origem = todos.min()
+        tamanho = int((todos.max() - origem).astype('int64')) + 1
+
+    leads = celulas['leads'].to_numpy()
+    gasto = celulas_gasto['Canal'].map(PRECO_CANAL_KPI).astype(float).fillna(0) * celulas_gasto['Quantidade']
+    acumulados = {
+        'leads': _acumular(dias_hubspot, leads, origem, tamanho),
+        'pagos': _acumular(dias_hubspot, np.where(celulas['etapa'] == 'PAGO', leads, 0), origem, tamanho),
+        'comissao': _acumular(dias_hubspot, celulas['comissao_gerada'].fillna(0), origem, tamanho),
+        'gasto': _acumular(dias_gasto, gasto, origem, tamanho),
+    }
+    return IndiceDiario(origem, acumulados)
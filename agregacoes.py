@@ -0,0 +1,200 @@
+import numpy as np
+import pandas as pd
+
+import config
+from acumulados import montar_indice_diario
+from cache import CacheLRU
+from cohort import MatrizCohort, montar_cohort
+from distintos import densos
+from quantis import NUMERO_CHAVES, resumo_boxplot
+
+CHAVES_CONVENIO_PRODUTO = ['convenio_acronimo', 'produto']
+
+cache_agregacoes = CacheLRU(
+    max_entradas=config.CACHE_AGREGACOES_MAX_ENTRADAS,
+    max_bytes=config.CACHE_AGREGACOES_MAX_MB * 1024 ** 2,
+)
+
+
+def _congelar(valores):
+    # Lista de seleção -> tupla hashável (None = sem restrição)
+    if valores is None:
+        return None
+    return tuple(sorted(str(valor) for valor in valores))
+
+
+def estado_filtro(selecao_hubspot, selecao_gasto, inicio, fim, calendario):
+    return (
+        tuple((dimensao, _congelar(valores)) for dimensao, valores in selecao_hubspot.items()),
+        tuple((dimensao, _congelar(valores)) for dimensao, valores in selecao_gasto.items()),
+        inicio, fim,
+        # Só dias úteis? e de qual calendário (UF)
+        None if calendario is None else ('dias_uteis', calendario.uf),
+    )
+
+
+class CamadaAgregacoes:
+    """Agregações compartilhadas pelos painéis para um estado de filtro.
+
+    Cada agregação é calculada uma vez por (cubos, estado do filtro) e guardada no
+    cache_agregacoes; mexer num controle local de um painel (ex.: top_n) reaproveita
+    tudo. Os frames devolvidos são compartilhados: os painéis não devem alterá-los.
+    """
+
+    def __init__(self, cubo, cubo_gasto, selecao_hubspot, selecao_gasto, inicio, fim, calendario):
+        self.cubo = cubo
+        self.cubo_gasto = cubo_gasto
+        self.selecao_hubspot = selecao_hubspot
+        self.selecao_gasto = selecao_gasto
+        self.inicio, self.fim = inicio, fim
+        self.calendario = calendario
+        # Os cubos entram na chave pelo próprio objeto (hash por identidade)
+        self.chave = (cubo, cubo_gasto, estado_filtro(selecao_hubspot, selecao_gasto, inicio, fim, calendario))
+        # Agregações que não dependem do intervalo de datas
+        self.chave_sem_datas = (cubo, cubo_gasto, estado_filtro(selecao_hubspot, selecao_gasto, None, None, calendario))
+
+    def _memo(self, nome, funcao, chave=None):
+        return cache_agregacoes.obter_ou_calcular((chave or self.chave, nome), funcao)
+
+    def celulas(self):
+        return self._memo('celulas', lambda: self.cubo.filtrar(
+            self.selecao_hubspot, self.inicio, self.fim, self.calendario))
+
+    def celulas_gasto(self):
+        return self._memo('celulas_gasto', lambda: self.cubo_gasto.filtrar(
+            self.selecao_gasto, self.inicio, self.fim, self.calendario))
+
+    def indice_diario(self):
+        # Somas acumuladas por dia em todo o período: trocar só as datas reaproveita o índice
+        return self._memo('indice_diario', lambda: montar_indice_diario(
+            self.cubo.filtrar(self.selecao_hubspot, calendario=self.calendario),
+            self.cubo_gasto.filtrar(self.selecao_gasto, calendario=self.calendario),
+        ), chave=self.chave_sem_datas)
+
+    def somas(self, chaves, medidas):
+        # Medidas das células do filtro somadas por `chaves` (ordenadas, sem chave nula); é a
+        # conta dos painéis, que os outros backends fazem sobre as linhas
+        def calcular():
+            celulas = self.celulas()
+            if not chaves:
+                return pd.DataFrame({medida: [celulas[medida].sum()] for medida in medidas})
+            return celulas.groupby(list(chaves), observed=True)[list(medidas)].sum().reset_index()
+        return self._memo(('somas', tuple(chaves), tuple(medidas)), calcular)
+
+    def gasto_por_convenio_produto(self):
+        def calcular():
+            gasto = self.celulas_gasto().groupby(['Convênio', 'Produto'], observed=True)['Valor Gasto'].sum().reset_index(name='gasto_total')
+            return gasto.rename(columns={'Convênio': 'convenio_acronimo', 'Produto': 'produto'})
+        return self._memo('gasto_por_convenio_produto', calcular)
+
+    def comissao_paga_por_convenio_produto(self):
+        def calcular():
+            somas = self.somas(['etapa'] + CHAVES_CONVENIO_PRODUTO, ['comissao_gerada'])
+            return somas[somas['etapa'] == 'PAGO'].drop(columns='etapa').reset_index(drop=True)
+        return self._memo('comissao_paga_por_convenio_produto', calcular)
+
+    def leads_por_convenio_produto(self):
+        return self._memo('leads_por_convenio_produto', lambda: self.somas(
+            CHAVES_CONVENIO_PRODUTO, ['leads']).rename(columns={'leads': 'clientes'}))
+
+    def _juntar_com_gasto(self, nome, outro, coluna):
+        def calcular():
+            juntos = pd.merge(self.gasto_por_convenio_produto(), outro(), on=CHAVES_CONVENIO_PRODUTO, how='outer')
+            juntos[['gasto_total', coluna]] = juntos[['gasto_total', coluna]].fillna(0)
+            return juntos
+        return self._memo(nome, calcular)
+
+    def gasto_x_comissao(self):
+        # Usado por "Gasto por Convênio e Produto" e pelo ROI
+        return self._juntar_com_gasto('gasto_x_comissao', self.comissao_paga_por_convenio_produto, 'comissao_gerada')
+
+    def gasto_x_leads(self):
+        # Usado pelo CAC
+        return self._juntar_com_gasto('gasto_x_leads', self.leads_por_convenio_produto, 'clientes')
+
+    def cohort(self, dias, posicoes, coluna_evento, horizonte, agrupamento):
+        # dias: DiasDataset do HubSpot; posicoes: linhas do estado de filtro atual
+        return self._memo(('cohort', coluna_evento, horizonte, agrupamento), lambda: montar_cohort(
+            dias.dias['data'][posicoes], dias.dias[coluna_evento][posicoes], horizonte, agrupamento))
+
+    def esbocos_clientes(self, inicio, fim):
+        # Registros HyperLogLog dos CPFs da seleção entre `inicio` e `fim`: (todos os leads,
+        # só os pagos), combinados das células sem reler linhas
+        def calcular():
+            posicoes = self.cubo.indice.posicoes(self.selecao_hubspot, inicio, fim, self.calendario)
+            pagos = posicoes[(self.cubo.celulas['etapa'] == 'PAGO').to_numpy()[posicoes]]
+            return self.cubo.distintos.combinar(posicoes), self.cubo.distintos.combinar(pagos)
+        return self._memo(('esbocos_clientes', inicio, fim), calcular, chave=self.chave_sem_datas)
+
+    def resumo_comissao_por_convenio(self):
+        # Boxplot da comissão projetada pelos esboços das células selecionadas (sem reler linhas)
+        def calcular():
+            indice = self.cubo.indice
+            posicoes = indice.posicoes(self.selecao_hubspot, self.inicio, self.fim, self.calendario)
+            convenios = indice.valores['convenio_acronimo']
+            contagens = self.cubo.esbocos.combinar(posicoes, indice.codigos['convenio_acronimo'], len(convenios))
+            return resumo_boxplot(contagens, convenios)
+        return self._memo('resumo_comissao_por_convenio', calcular)
+
+
+class CamadaAgregacoesMotor(CamadaAgregacoes):
+    """CamadaAgregacoes com as agregações sobre linhas feitas pelo próprio motor (backends
+    DuckDB e Polars).
+
+    Células, somas dos painéis, totais por dia, esboços e cohorts vêm do motor; junções
+    com o gasto, CAC e ROI são herdadas e rodam sobre esses resultados. O motor entra no
+    lugar dos dois cubos na chave do cache.
+    """
+
+    def __init__(self, motor, selecao_hubspot, selecao_gasto, inicio, fim, calendario):
+        super().__init__(motor, motor, selecao_hubspot, selecao_gasto, inicio, fim, calendario)
+        self.motor = motor
+
+    def celulas(self):
+        return self._memo('celulas', lambda: self.motor.celulas(
+            self.selecao_hubspot, self.inicio, self.fim, self.calendario))
+
+    def somas(self, chaves, medidas):
+        return self._memo(('somas', tuple(chaves), tuple(medidas)), lambda: self.motor.somas(
+            self.selecao_hubspot, self.inicio, self.fim, self.calendario, chaves, medidas))
+
+    def celulas_gasto(self):
+        return self._memo('celulas_gasto', lambda: self.motor.celulas_gasto(
+            self.selecao_gasto, self.inicio, self.fim, self.calendario))
+
+    def indice_diario(self):
+        return self._memo('indice_diario', lambda: montar_indice_diario(
+            *self.motor.totais_por_dia(self.selecao_hubspot, self.selecao_gasto, self.calendario)
+        ), chave=self.chave_sem_datas)
+
+    def cohort(self, coluna_evento, horizonte, agrupamento):
+        def calcular():
+            contagens = self.motor.contagens_cohort(self.selecao_hubspot, self.inicio, self.fim, self.calendario,
+                                                    coluna_evento, horizonte, agrupamento)
+            cohorts = pd.DatetimeIndex(np.sort(contagens['cohort'].unique())).as_unit('ns')
+            codigos = cohorts.get_indexer(contagens['cohort'])
+            quantidades = contagens['quantidade'].to_numpy()
+            tamanhos = np.bincount(codigos, weights=quantidades, minlength=len(cohorts)).astype('int64')
+            com_evento = contagens['deslocamento'].notna().to_numpy()
+            largura = horizonte + 1
+            celulas = codigos[com_evento] * largura + contagens['deslocamento'][com_evento].to_numpy('int64')
+            eventos = np.bincount(celulas, weights=quantidades[com_evento], minlength=len(cohorts) * largura)
+            return MatrizCohort(cohorts, tamanhos, eventos.astype('int64').reshape(len(cohorts), largura))
+        return self._memo(('cohort', coluna_evento, horizonte, agrupamento), calcular)
+
+    def resumo_comissao_por_convenio(self):
+        def calcular():
+            esboco = self.motor.esboco_comissao(self.selecao_hubspot, self.inicio, self.fim, self.calendario)
+            convenios = pd.Index(sorted(esboco['convenio_acronimo'].unique()))
+            indices = convenios.get_indexer(esboco['convenio_acronimo']) * NUMERO_CHAVES + esboco['chave'].to_numpy()
+            contagens = np.bincount(indices, weights=esboco['quantidade'], minlength=len(convenios) * NUMERO_CHAVES)
+            return resumo_boxplot(contagens.reshape(len(convenios), NUMERO_CHAVES), convenios)
+        return self._memo('resumo_comissao_por_convenio', calcular)
+
+    def esbocos_clientes(self, inicio, fim):
+        def calcular():
+            esboco = self.motor.esboco_clientes(self.selecao_hubspot, inicio, fim, self.calendario)
+            pagos = esboco['pago'].to_numpy(dtype=bool)
+            registro, posto = esboco['registro'].to_numpy(), esboco['posto'].to_numpy()
+            return densos(registro, posto), densos(registro[pagos], posto[pagos])
+        return self._memo(('esbocos_clientes', inicio, fim), calcular, chave=self.chave_sem_datas)
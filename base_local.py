@@ -0,0 +1,175 @@
+import json
+import threading
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from cache import hash_conteudo
+from ingestao import carregar_gasto, carregar_hubspot, chave_arquivo
+from tratamento import VERSAO_TRATAMENTO, modificado_em, resolver_repetidos
+
+# Acima disso as partes de uma tabela são compactadas num único arquivo
+MAX_PARTES = 8
+
+CARREGADORES = {
+    'hubspot': carregar_hubspot,
+    'gasto': carregar_gasto,
+}
+
+
+class BaseLocal:
+    """Base em disco (Parquet) com os dados já tratados do HubSpot e do gasto.
+
+    Cada arquivo novo vira uma parte Parquet; na leitura as partes são unidas e as
+    linhas repetidas resolvidas (HubSpot por `id`, vence a modificação mais recente;
+    gasto por CHAVE_GASTO, vence o arquivo mais novo). Arquivos já ingeridos são
+    reconhecidos pelo hash do conteúdo + versão do tratamento e não são processados de
+    novo. As partes gravadas por outra versão do tratamento são descartadas ao abrir a
+    base (os bytes originais não ficam guardados para tratar de novo): os arquivos
+    descartados ficam em `descartados`, para serem enviados outra vez.
+    """
+
+    def __init__(self, diretorio):
+        self.diretorio = Path(diretorio)
+        self._caminho_manifesto = self.diretorio / 'manifesto.json'
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        with self._lock:
+            self.descartados = self._descartar_obsoletos()
+
+    def _ler_manifesto(self):
+        if self._caminho_manifesto.exists():
+            return json.loads(self._caminho_manifesto.read_text(encoding='utf-8'))
+        return {'sequencia': 0, 'arquivos': {}}
+
+    def _gravar_manifesto(self, manifesto):
+        temporario = self._caminho_manifesto.with_suffix('.tmp')
+        temporario.write_text(json.dumps(manifesto, ensure_ascii=False, indent=1), encoding='utf-8')
+        temporario.replace(self._caminho_manifesto)
+
+    def _partes(self, tabela):
+        return sorted((self.diretorio / tabela).glob('parte-*.parquet'))
+
+    def _descartar_obsoletos(self):
+        # Tabelas com algum arquivo de outra versão do tratamento perdem todas as partes
+        # (a compactação mistura os arquivos, e colunas/dtypes não batem com os atuais).
+        # Como a limpeza roda antes de qualquer gravação, uma tabela nunca mistura versões
+        manifesto = self._ler_manifesto()
+        obsoletas = {arquivo['tabela'] for arquivo in manifesto['arquivos'].values()
+                     if arquivo.get('versao_tratamento') != VERSAO_TRATAMENTO}
+        if not obsoletas:
+            return []
+        descartados = [arquivo['nome'] for arquivo in manifesto['arquivos'].values()
+                       if arquivo['tabela'] in obsoletas]
+        for tabela in obsoletas:
+            for parte in self._partes(tabela):
+                parte.unlink()
+        manifesto['arquivos'] = {chave: arquivo for chave, arquivo in manifesto['arquivos'].items()
+                                 if arquivo['tabela'] not in obsoletas}
+        self._gravar_manifesto(manifesto)
+        return descartados
+
+    def descartados_pendentes(self):
+        # Arquivos descartados pela troca de versão que ainda não foram enviados de novo
+        nomes = {arquivo['nome'] for arquivo in self._ler_manifesto()['arquivos'].values()}
+        return [nome for nome in self.descartados if nome not in nomes]
+
+    def ja_ingerido(self, tabela, conteudo, chave=None):
+        # `chave`: a chave_arquivo já calculada (poupa o hash do conteúdo)
+        return (chave or chave_arquivo(tabela, conteudo)) in self._ler_manifesto()['arquivos']
+
+    def adicionar(self, tabela, conteudo, nome='', chave=None):
+        # Devolve False se o arquivo já estava na base
+        chave = chave or chave_arquivo(tabela, conteudo)
+        with self._lock:
+            manifesto = self._ler_manifesto()
+            if chave in manifesto['arquivos']:
+                return False
+            dataframe = CARREGADORES[tabela](conteudo, chave)
+            sequencia = manifesto['sequencia'] + 1
+            parte = dataframe.assign(_sequencia=sequencia)
+            if tabela == 'hubspot':
+                parte['_modificado_em'] = modificado_em(parte)
+
+            pasta = self.diretorio / tabela
+            pasta.mkdir(parents=True, exist_ok=True)
+            parte.to_parquet(pasta / f'parte-{sequencia:06d}.parquet', index=False)
+
+            manifesto['sequencia'] = sequencia
+            manifesto['arquivos'][chave] = {
+                'tabela': tabela,
+                'nome': nome,
+                'linhas': len(dataframe),
+                'versao_tratamento': VERSAO_TRATAMENTO,
+            }
+            self._gravar_manifesto(manifesto)
+
+            if len(self._partes(tabela)) > MAX_PARTES:
+                self._compactar(tabela, sequencia)
+        return True
+
+    def _ler_partes(self, partes):
+        # memory_map evita cópia intermediária dos bytes do arquivo
+        tabelas = [pq.read_table(parte, memory_map=True) for parte in partes]
+        tabela = pa.concat_tables(tabelas, promote_options='permissive')
+        return tabela.unify_dictionaries().to_pandas()
+
+    def _compactar(self, tabela, sequencia):
+        partes = self._partes(tabela)
+        dataframe = resolver_repetidos(tabela, self._ler_partes(partes))
+        destino = self.diretorio / tabela / f'parte-{sequencia:06d}.parquet'
+        temporario = destino.with_suffix('.tmp')
+        dataframe.to_parquet(temporario, index=False)
+        for parte in partes:
+            parte.unlink()
+        temporario.replace(destino)
+
+    def _assinatura(self, partes):
+        return tuple((parte.name, parte.stat().st_mtime_ns) for parte in partes)
+
+    def assinatura(self):
+        # Chave do conteúdo atual da base (muda a cada parte gravada ou compactada);
+        # None sem dados do HubSpot
+        partes = {tabela: self._partes(tabela) for tabela in ['hubspot', 'gasto']}
+        if not partes['hubspot']:
+            return None
+        return hash_conteudo(str(self.diretorio.resolve()), *(
+            f'{tabela}/{nome}:{mtime}' for tabela in partes for nome, mtime in self._assinatura(partes[tabela])
+        ))
+
+    def carregar(self, tabela):
+        # Snapshot em memória, refeito só quando as partes em disco mudam
+        partes = self._partes(tabela)
+        if not partes:
+            return None
+        assinatura = self._assinatura(partes)
+        snapshot = self._snapshots.get(tabela)
+        if snapshot and snapshot[0] == assinatura:
+            return snapshot[1]
+        dataframe = resolver_repetidos(tabela, self._ler_partes(partes))
+        dataframe = dataframe.drop(columns=['_sequencia', '_modificado_em'], errors='ignore').reset_index(drop=True)
+        self._snapshots[tabela] = (assinatura, dataframe)
+        return dataframe
+
+    def estatisticas(self):
+        manifesto = self._ler_manifesto()
+        return {
+            'arquivos_ingeridos': len(manifesto['arquivos']),
+            'partes_hubspot': len(self._partes('hubspot')),
+            'partes_gasto': len(self._partes('gasto')),
+            'versao_tratamento': VERSAO_TRATAMENTO,
+            'arquivos_descartados': len(self.descartados_pendentes()),
+        }
+
+
+_bases = {}
+_lock_bases = threading.Lock()
+
+
+def abrir_base(diretorio):
+    # Uma instância por diretório, no nível do módulo, para o snapshot sobreviver aos reruns
+    with _lock_bases:
+        if diretorio not in _bases:
+            _bases[diretorio] = BaseLocal(diretorio)
+        return _bases[diretorio]
@@ -0,0 +1,221 @@
+"""Mede tempo e pico de memória de cada etapa do painel, da leitura do CSV aos gráficos.
+
+Uso:
+    python benchmarks/bench_pipeline.py --linhas 10000 100000 1000000
+    python benchmarks/bench_pipeline.py --linhas 1000000 --comparar benchmarks/resultados/abc1234.json
+
+Os dados vêm de benchmarks/gerar_dados.py (gerados uma vez por tamanho em --dados).
+Cada etapa roda com todos os caches vazios; o tempo é o menor de --repeticoes execuções
+e o pico de memória (tracemalloc) é medido numa execução à parte, para o rastreamento
+não pesar no tempo. O resultado vai para benchmarks/resultados/<commit>.json, que pode
+ser passado a --comparar numa execução em outro commit.
+"""
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+RAIZ = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(RAIZ))
+
+from agregacoes import cache_agregacoes  # noqa: E402
+from cohort import cache_dias  # noqa: E402
+from cubo import cache_cubos  # noqa: E402
+from datas import parser_gasto, parser_hubspot  # noqa: E402
+from filtros import cache_indices  # noqa: E402
+from gerar_dados import gerar_arquivos  # noqa: E402
+from graficos import (  # noqa: E402
+    cache_graficos,
+    grafico_cac,
+    grafico_cohort,
+    grafico_comissao,
+    grafico_funil,
+    grafico_gasto_convenio,
+    grafico_leads_convenio,
+    grafico_leads_dia,
+    grafico_perda_convenio,
+    grafico_perda_motivo,
+    grafico_roi,
+)
+from ingestao import cache_alinhamento, cache_ingestao, ler_hubspot_em_blocos  # noqa: E402
+from metricas import MotorMetricas  # noqa: E402
+from tratamento import tratar_arquivo_hubspot, tratar_arquivo_pagos  # noqa: E402
+
+CACHES = [cache_ingestao, cache_alinhamento, cache_indices, cache_cubos, cache_agregacoes, cache_dias,
+          cache_graficos, parser_hubspot, parser_gasto]
+
+# Sem --filtro: período todo, só dias úteis (como o painel abre)
+FILTRO_PADRAO = {'apenas_dias_uteis': True}
+
+
+def limpar_caches():
+    for cache in CACHES:
+        cache.limpar()
+
+
+def medir(funcao, repeticoes, preparar=None):
+    # (menor tempo em s, pico de memória em MB, resultado); `preparar` roda fora da medição
+    # e devolve os argumentos da função (ex.: uma cópia do frame que o tratamento altera)
+    tempos = []
+    for _ in range(repeticoes):
+        limpar_caches()
+        argumentos = preparar() if preparar else ()
+        inicio = time.perf_counter()
+        resultado = funcao(*argumentos)
+        tempos.append(time.perf_counter() - inicio)
+    limpar_caches()
+    argumentos = preparar() if preparar else ()
+    tracemalloc.start()
+    try:
+        funcao(*argumentos)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(tempos), pico / 1024 ** 2, resultado
+
+
+def etapas_agregacao(consulta):
+    # Agregações de cada painel, na ordem do dashboard
+    return {
+        'kpis': consulta.kpis,
+        'celulas': consulta.celulas,
+        'gasto_convenio': lambda: consulta.gasto_x_comissao(10),
+        'leads_convenio': consulta.leads_por_convenio,
+        'leads_dia': consulta.leads_por_dia,
+        'perda_convenio': consulta.perdas_por_convenio,
+        'perda_motivo': lambda: consulta.perdas_por_motivo(5),
+        'comissao': consulta.comissao_por_convenio,
+        'funil': consulta.funil,
+        'cohort': lambda: consulta.cohort('data_pago'),
+        'cac': lambda: consulta.cac(10),
+        'roi': lambda: consulta.roi(10),
+    }
+
+
+def etapas_grafico(consulta):
+    # Montagem de cada figura a partir do agregado já calculado
+    total = consulta.kpis()['leads']
+    leads_dia_produto, leads_dia_total = consulta.leads_por_dia()
+    resumo, outliers = consulta.comissao_por_convenio()
+    taxas, tamanhos = consulta.cohort('data_pago')
+    entradas = {
+        'gasto_convenio': (grafico_gasto_convenio, consulta.gasto_x_comissao(10)),
+        'leads_convenio': (grafico_leads_convenio, consulta.leads_por_convenio()),
+        'leads_dia': (grafico_leads_dia, leads_dia_produto, leads_dia_total),
+        'perda_convenio': (grafico_perda_convenio, consulta.perdas_por_convenio(), total),
+        'perda_motivo': (grafico_perda_motivo, consulta.perdas_por_motivo(5), total),
+        'comissao': (grafico_comissao, resumo, outliers),
+        'funil': (grafico_funil, consulta.funil()),
+        'cohort': (grafico_cohort, taxas, tamanhos, 'Pagamento'),
+        'cac': (grafico_cac, consulta.cac(10)),
+        'roi': (grafico_roi, consulta.roi(10)),
+    }
+    return {nome: (lambda construir=construir, argumentos=argumentos: construir(*argumentos))
+            for nome, (construir, *argumentos) in entradas.items()}
+
+
+def medir_pipeline(caminho_hubspot, caminho_gasto, linhas, repeticoes, filtro):
+    resultados = []
+
+    def registrar(etapa, funcao, preparar=None):
+        segundos, pico_mb, resultado = medir(funcao, repeticoes, preparar)
+        resultados.append({'linhas': linhas, 'etapa': etapa, 'segundos': segundos, 'pico_mb': pico_mb})
+        print(f'{linhas:>10} {etapa:<28} {segundos:>10.4f} {pico_mb:>10.1f}')
+        return resultado
+
+    bruto = registrar('leitura', lambda: pd.read_csv(caminho_hubspot))
+    bruto_gasto = registrar('leitura_gasto', lambda: pd.read_csv(caminho_gasto, sep=';'))
+    df = registrar('tratamento', tratar_arquivo_hubspot, lambda: (bruto.copy(),))
+    df_gasto = registrar('tratamento_gasto', tratar_arquivo_pagos, lambda: (bruto_gasto.copy(),))
+    del bruto, bruto_gasto
+    # Caminho dos arquivos grandes: leitura em blocos só com as colunas usadas + tratamento
+    registrar('leitura_em_blocos', lambda: ler_hubspot_em_blocos(caminho_hubspot))
+
+    # Alinhamento + índice de filtros + cubos (uma vez por dataset)
+    motor = registrar('preparacao', lambda: MotorMetricas(df, df_gasto))
+    consulta = registrar('filtro', lambda: motor.consulta(**filtro))
+
+    for nome, funcao in etapas_agregacao(consulta).items():
+        registrar(f'agregacao:{nome}', funcao)
+
+    # Os agregados ficam prontos antes; só a montagem da figura é medida
+    for nome, construir in etapas_grafico(consulta).items():
+        registrar(f'grafico:{nome}', construir)
+    return resultados
+
+
+def commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'sem-git'
+
+
+def comparar(resultados, caminho_anterior):
+    anterior = json.loads(Path(caminho_anterior).read_text(encoding='utf-8'))
+    base = {(item['linhas'], item['etapa']): item for item in anterior['resultados']}
+    print(f"\nComparação com {anterior['commit']} (tempo e pico: atual / anterior)")
+    print(f"{'linhas':>10} {'etapa':<28} {'tempo':>8} {'pico':>8}")
+    for item in resultados:
+        antigo = base.get((item['linhas'], item['etapa']))
+        if not antigo:
+            continue
+        razao_tempo = item['segundos'] / antigo['segundos'] if antigo['segundos'] else float('nan')
+        razao_pico = item['pico_mb'] / antigo['pico_mb'] if antigo['pico_mb'] else float('nan')
+        print(f"{item['linhas']:>10} {item['etapa']:<28} {razao_tempo:>7.2f}x {razao_pico:>7.2f}x")
+
+
+def main():
+    # Copy-on-write, como no painel (hubspot.py)
+    pd.set_option('mode.copy_on_write', True)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--dados', default='dados_sinteticos', help='Pasta dos dados gerados (uma subpasta por tamanho)')
+    parser.add_argument('--filtro', help='JSON com o filtro da consulta (mesmo formato do relatorio.py)')
+    parser.add_argument('--saida', help='Arquivo de resultado (padrão: benchmarks/resultados/<commit>.json)')
+    parser.add_argument('--comparar', help='Resultado de outro commit para comparar')
+    args = parser.parse_args()
+
+    filtro = json.loads(Path(args.filtro).read_text(encoding='utf-8')) if args.filtro else FILTRO_PADRAO
+
+    print(f"{'linhas':>10} {'etapa':<28} {'tempo (s)':>10} {'pico (MB)':>10}")
+    resultados = []
+    for linhas in args.linhas:
+        pasta = Path(args.dados) / str(linhas)
+        caminho_hubspot, caminho_gasto = pasta / 'hubspot.csv', pasta / 'gasto.csv'
+        if not (caminho_hubspot.exists() and caminho_gasto.exists()):
+            gerar_arquivos(linhas, pasta)
+        resultados += medir_pipeline(caminho_hubspot, caminho_gasto, linhas, args.repeticoes, filtro)
+
+    commit = commit_atual()
+    saida = Path(args.saida) if args.saida else RAIZ / 'benchmarks' / 'resultados' / f'{commit}.json'
+    saida.parent.mkdir(parents=True, exist_ok=True)
+    saida.write_text(json.dumps({
+        'commit': commit,
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'repeticoes': args.repeticoes,
+        'filtro': filtro,
+        # Pico de memória residente do processo inteiro (Linux: KB)
+        'rss_max_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'resultados': resultados,
+    }, ensure_ascii=False, indent=1), encoding='utf-8')
+    print(f'\n{saida}')
+
+    if args.comparar:
+        comparar(resultados, args.comparar)
+
+
+if __name__ == '__main__':
+    main()
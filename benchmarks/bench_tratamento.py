@@ -0,0 +1,158 @@
+"""Compara o tratar_arquivo_hubspot vetorizado com a implementação original (por linha).
+
+Uso:
+    python benchmarks/bench_tratamento.py --linhas 100000 1000000 5000000
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from distintos import registros  # noqa: E402
+from tratamento import (  # noqa: E402
+    ACRONIMOS_CONVENIO,
+    MAPA_COLUNAS,
+    MOTIVOS_PRINCIPAIS,
+    tratar_arquivo_hubspot,
+)
+
+
+def tratar_arquivo_hubspot_original(dataframe):
+    # Cópia da implementação anterior (apply por linha), mantida só como referência
+    dataframe.columns = dataframe.columns.map(MAPA_COLUNAS)
+
+    motivos_principais = list(MOTIVOS_PRINCIPAIS)
+    dataframe['motivo_fechamento_agrupado'] = dataframe['motivo_fechamento'].apply(
+        lambda x: x if x in motivos_principais else 'Outros'
+    )
+
+    def criar_acronimo(convenio):
+        if isinstance(convenio, str):
+            convenio = convenio.lower()
+        else:
+            convenio = ''
+        mapeamento = dict(ACRONIMOS_CONVENIO)
+        return mapeamento.get(convenio, convenio)
+    dataframe['convenio_acronimo'] = dataframe['convenio'].apply(criar_acronimo)
+
+    dataframe.loc[dataframe['equipe'].str.contains('Sales', case=False, na=False), 'equipe'] = 'Sales'
+    dataframe.loc[dataframe['equipe'].str.contains('Cs Ativação', case=False, na=False), 'equipe'] = 'Cs Ativacao'
+    dataframe.loc[dataframe['equipe'].str.contains('Cs App', case=False, na=False), 'equipe'] = 'Cs App'
+
+    dataframe['data_criado'] = pd.to_datetime(dataframe['data_criado'], errors='coerce')
+    dataframe['data'] = dataframe['data_criado'].dt.date
+    dataframe['horario_criado'] = dataframe['data_criado'].dt.time
+    dataframe.drop(columns=['data_criado'], inplace=True)
+
+    dataframe['data_lead'] = pd.to_datetime(dataframe['data_lead'], errors='coerce').dt.date
+    dataframe['data_negociacao'] = pd.to_datetime(dataframe['data_negociacao'], errors='coerce').dt.date
+    dataframe['data_contratacao'] = pd.to_datetime(dataframe['data_contratacao'], errors='coerce').dt.date
+    dataframe['data_pago'] = pd.to_datetime(dataframe['data_pago'], errors='coerce').dt.date
+
+    # A original não normalizava CPF/telefone; o mesmo passo, por linha, para a
+    # comparação ser do mesmo trabalho
+    def somente_digitos(valor, prefixo=None):
+        if not isinstance(valor, str):
+            if pd.isna(valor):
+                return None
+            valor = str(int(valor))
+        digitos = re.sub(r'\D', '', valor)
+        if prefixo:
+            digitos = re.sub(prefixo, '', digitos)
+        if not digitos or len(digitos) > 18 or int(digitos) == 0:
+            return None
+        return int(digitos)
+    dataframe['cpf'] = dataframe['cpf'].apply(somente_digitos).astype('Int64')
+    dataframe['telefone'] = dataframe['telefone'].apply(
+        somente_digitos, prefixo=r'^55(?=\d{10,11}$)'
+    ).astype('Int64')
+    dataframe['registro_cpf'], dataframe['posto_cpf'] = registros(dataframe['cpf'])
+    return dataframe
+
+
+def gerar_hubspot(linhas, semente=0):
+    rng = np.random.default_rng(semente)
+    convenios = [nome.title() for nome in ACRONIMOS_CONVENIO] + ['Convênio Sem Sigla', None]
+    motivos = list(MOTIVOS_PRINCIPAIS) + ['Outro motivo', None]
+    # Os três últimos têm mais de um trecho das REGRAS_EQUIPE (vale o primeiro da lista)
+    equipes = ['Time Sales 1', 'Sales 2', 'Cs Ativação', 'Cs App Norte', 'Backoffice', None,
+               'Sales Cs App', 'Time Sales - Cs Ativação', 'Cs App - Cs Ativação']
+    datas = pd.date_range('2024-01-01', '2024-12-31 23:00', freq='37min').strftime('%Y-%m-%d %H:%M').to_numpy()
+
+    def coluna_mascarada(mascara, digitos, preenchidas):
+        # Documentos com máscara, como vêm do HubSpot, alguns em branco
+        numeros = rng.integers(10 ** (digitos - 1), 10 ** digitos, linhas).astype(str)
+        valores = np.array([mascara.format(numero) for numero in numeros], dtype=object)
+        valores[rng.random(linhas) > preenchidas] = None
+        return valores
+
+    def coluna_data(preenchidas):
+        valores = rng.choice(datas, linhas).astype(object)
+        valores[rng.random(linhas) > preenchidas] = None
+        return valores
+
+    colunas = {origem: None for origem in MAPA_COLUNAS}
+    colunas.update({
+        'ID do registro.': np.arange(linhas),
+        'Data de criação': coluna_data(1.0),
+        'CPF': coluna_mascarada('{0[0]}{0[1]}{0[2]}.{0[3]}{0[4]}{0[5]}.{0[6]}{0[7]}{0[8]}-{0[9]}{0[10]}', 11, 0.9),
+        'Telefone': coluna_mascarada('+55 ({0[0]}{0[1]}) {0[2]}{0[3]}{0[4]}{0[5]}{0[6]}-{0[7]}{0[8]}{0[9]}{0[10]}', 11, 0.8),
+        'Convênio': rng.choice(np.array(convenios, dtype=object), linhas),
+        'Origem': rng.choice(['SMS', 'RCS'], linhas),
+        'Tipo de Campanha': rng.choice(['Novo', 'Cartão', 'Benefício', 'Port'], linhas),
+        'Equipe da HubSpot': rng.choice(np.array(equipes, dtype=object), linhas),
+        'Etapa do negócio': rng.choice(['LEAD', 'NEGOCIAÇÃO', 'CONTRATAÇÃO', 'PAGO', 'PERDA'], linhas),
+        'Motivo de fechamento perdido': rng.choice(np.array(motivos, dtype=object), linhas),
+        'Comissão total projetada': rng.random(linhas) * 1000,
+        'Valor': rng.random(linhas) * 500,
+    })
+    for origem, destino in MAPA_COLUNAS.items():
+        if destino.startswith('data_') and destino != 'data_criado':
+            colunas[origem] = coluna_data(0.4)
+    return pd.DataFrame(colunas)
+
+
+def comparavel(dataframe):
+    # category -> object, datetime64 -> date e nulos padronizados, para comparar as duas
+    # versões; data_perda (antes não era convertida) e horario_criado (antes time, agora
+    # timedelta) ficam de fora
+    dataframe = dataframe.drop(columns=['data_perda', 'horario_criado'])
+    for coluna in dataframe.columns:
+        if pd.api.types.is_datetime64_any_dtype(dataframe[coluna]):
+            dataframe[coluna] = dataframe[coluna].dt.date
+        if dataframe[coluna].dtype in ('object', 'category'):
+            serie = dataframe[coluna].astype(object)
+            dataframe[coluna] = serie.where(serie.notna(), np.nan)
+    return dataframe
+
+
+def medir(funcao, dataframe):
+    copia = dataframe.copy()
+    inicio = time.perf_counter()
+    resultado = funcao(copia)
+    return time.perf_counter() - inicio, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, nargs='+', default=[100_000, 1_000_000, 5_000_000])
+    args = parser.parse_args()
+
+    print(f"{'linhas':>10} {'original (linhas/s)':>20} {'vetorizado (linhas/s)':>22} {'ganho':>7}")
+    for linhas in args.linhas:
+        base = gerar_hubspot(linhas)
+        tempo_original, esperado = medir(tratar_arquivo_hubspot_original, base)
+        tempo_novo, obtido = medir(tratar_arquivo_hubspot, base)
+        pd.testing.assert_frame_equal(comparavel(esperado), comparavel(obtido))
+        print(f'{linhas:>10} {linhas / tempo_original:>20,.0f} {linhas / tempo_novo:>22,.0f} '
+              f'{tempo_original / tempo_novo:>6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
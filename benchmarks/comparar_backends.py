@@ -0,0 +1,153 @@
+"""Compara os backends de consulta (pandas, DuckDB e Polars): mesmos resultados e tempo de cada um.
+
+Uso:
+    python benchmarks/comparar_backends.py --linhas 100000 1000000
+    python benchmarks/comparar_backends.py --linhas 1000000 --backends pandas polars --repeticoes 5
+
+Para cada tamanho, os dados sintéticos (benchmarks/gerar_dados.py) entram numa base local
+temporária, e cada backend monta o seu motor a partir dela. Cada filtro roda o relatório
+completo (relatorio.py) em todos os backends, com o cache de agregações vazio; as tabelas
+são comparadas com as do pandas, com tolerância só para a ordem das somas em ponto
+flutuante. Termina com código 1 se algum backend divergir.
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+RAIZ = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(RAIZ))
+
+from base_local import BaseLocal  # noqa: E402
+from bench_pipeline import limpar_caches  # noqa: E402
+from gerar_dados import gerar_arquivos  # noqa: E402
+from metricas import MotorMetricas  # noqa: E402
+from motor_duckdb import MotorDuckDB, duckdb  # noqa: E402
+from motor_polars import MotorPolars, pl  # noqa: E402
+
+BACKENDS = {
+    'pandas': lambda base: MotorMetricas(base.carregar('hubspot'), base.carregar('gasto')),
+    'duckdb': MotorDuckDB.da_base,
+    'polars': MotorPolars.da_base,
+}
+
+# Pacote de cada backend opcional (None = não instalado)
+DEPENDENCIAS = {'duckdb': duckdb, 'polars': pl}
+
+
+def filtros_de_teste(motor):
+    # Período todo (com e sem dias úteis), dois meses do meio com um produto e feriados de SP,
+    # uma seleção de etapas e equipe, e o período todo sem os leads duplicados
+    data_min, data_max = motor.periodo_disponivel()
+    meio = data_min + (data_max - data_min) / 2
+    return {
+        'padrao': {},
+        'todos_os_dias': {'apenas_dias_uteis': False},
+        'produto_periodo': {'produto': motor.valores_presentes('produto')[:1], 'uf_feriados': 'SP',
+                            'inicio': meio.normalize(), 'fim': (meio + pd.Timedelta(days=60)).normalize()},
+        'etapas_equipe': {'etapa': ['PERDA', 'PAGO'], 'equipe': motor.valores_presentes('equipe')[:2]},
+        'sem_duplicados': {'excluir_duplicados': True},
+    }
+
+
+def diferencas(referencia, outro, nome):
+    # Descrição de cada divergência entre duas saídas do relatório (dict ou DataFrame)
+    if isinstance(referencia, dict):
+        return [f'{nome}.{chave}: {valor} != {outro.get(chave)}' for chave, valor in referencia.items()
+                if not (np.isclose(valor, outro.get(chave)) if isinstance(valor, float) else valor == outro.get(chave))]
+    referencia, outro = referencia.reset_index(), outro.reset_index()
+    if list(referencia.columns) != list(outro.columns):
+        return [f'{nome}: colunas {list(referencia.columns)} != {list(outro.columns)}']
+    if len(referencia) != len(outro):
+        return [f'{nome}: {len(referencia)} linhas != {len(outro)}']
+    encontradas = []
+    for coluna in referencia.columns:
+        a, b = referencia[coluna], outro[coluna]
+        if pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b):
+            iguais = np.allclose(a.astype(float), b.astype(float), rtol=1e-9, atol=1e-6, equal_nan=True)
+        else:
+            # Categorias do pandas x texto dos outros backends: compara os valores como texto
+            iguais = (a.astype(str).to_numpy() == b.astype(str).to_numpy()).all()
+        if not iguais:
+            encontradas.append(f'{nome}.{coluna}: valores diferentes')
+    return encontradas
+
+
+def medir(funcao, repeticoes):
+    # (menor tempo em s, resultado); o cache de agregações é limpo antes de cada execução
+    tempos = []
+    for _ in range(repeticoes):
+        limpar_caches()
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos), resultado
+
+
+def comparar_tamanho(pasta, linhas, backends, repeticoes):
+    divergencias = []
+    with tempfile.TemporaryDirectory(prefix='hubspot-base-') as diretorio:
+        base = BaseLocal(diretorio)
+        for tabela in ['hubspot', 'gasto']:
+            base.adicionar(tabela, (pasta / f'{tabela}.csv').read_bytes(), f'{tabela}.csv')
+
+        motores = {}
+        for nome in backends:
+            segundos, motores[nome] = medir(lambda: BACKENDS[nome](base), 1)
+            megas = motores[nome].memory_usage() / 1024 ** 2
+            print(f'{linhas:>10} {nome:<8} {"motor":<18} {segundos:>10.4f}   {megas:>8.1f} MB em memória')
+
+        for nome_filtro, filtro in filtros_de_teste(motores['pandas']).items():
+            referencia = None
+            for nome in backends:
+                segundos, relatorio = medir(lambda: motores[nome].consulta(**filtro).relatorio(), repeticoes)
+                print(f'{linhas:>10} {nome:<8} {nome_filtro:<18} {segundos:>10.4f}')
+                if referencia is None:
+                    referencia = relatorio
+                    continue
+                for tabela, saida in referencia.items():
+                    divergencias += [f'{linhas} {nome} {nome_filtro} {texto}'
+                                     for texto in diferencas(saida, relatorio[tabela], tabela)]
+        # Os motores fecham o banco temporário antes de a base sair do disco
+        del motores
+    return divergencias
+
+
+def main():
+    # Copy-on-write, como no painel (hubspot.py)
+    pd.set_option('mode.copy_on_write', True)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, nargs='+', default=[100_000])
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--dados', default='dados_sinteticos', help='Pasta dos dados gerados (uma subpasta por tamanho)')
+    args = parser.parse_args()
+
+    # O pandas é a referência da comparação; backends sem o pacote instalado ficam de fora
+    backends = ['pandas'] + [nome for nome in args.backends if nome != 'pandas']
+    for nome in backends:
+        if nome in DEPENDENCIAS and DEPENDENCIAS[nome] is None:
+            print(f'{nome}: pacote não instalado, backend ignorado')
+    backends = [nome for nome in backends if DEPENDENCIAS.get(nome, True) is not None]
+
+    print(f"{'linhas':>10} {'backend':<8} {'etapa':<18} {'tempo (s)':>10}")
+    divergencias = []
+    for linhas in args.linhas:
+        pasta = Path(args.dados) / str(linhas)
+        if not ((pasta / 'hubspot.csv').exists() and (pasta / 'gasto.csv').exists()):
+            gerar_arquivos(linhas, pasta)
+        divergencias += comparar_tamanho(pasta, linhas, backends, args.repeticoes)
+
+    if divergencias:
+        print('\nResultados divergentes:')
+        print('\n'.join(divergencias))
+        sys.exit(1)
+    print('\nMesmos resultados em todos os backends')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""Gera exportações sintéticas do HubSpot e o arquivo de gasto correspondente (testes de escala).
+
+Uso:
+    python benchmarks/gerar_dados.py --linhas 1000000 --saida dados/
+    python benchmarks/gerar_dados.py --linhas 10000000 --dias 730 --saida dados_10m/
+
+Os arquivos seguem os formatos reais: o do HubSpot com os cabeçalhos de MAPA_COLUNAS
+(separado por vírgula, datas "AAAA-MM-DD HH:MM"), o de gasto separado por ";" com
+Data (DD/MM/AAAA), Canal, Quantidade, Convênio, Produto e Equipe. As linhas são geradas
+e gravadas em blocos, então 10 milhões de linhas cabem em pouca memória.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from tratamento import (  # noqa: E402
+    ACRONIMOS_CONVENIO,
+    MAPA_COLUNAS,
+    MOTIVOS_PRINCIPAIS,
+    criar_acronimo,
+    normalizar_equipe,
+)
+
+# Convênios como aparecem no HubSpot (os últimos não têm sigla cadastrada)
+CONVENIOS = [nome.title() for nome in ACRONIMOS_CONVENIO] + ['Prefeitura de Campinas', 'Governo de Sergipe']
+PRODUTOS = {'Novo': 0.40, 'Cartão': 0.25, 'Benefício': 0.15, 'Benefício e Cartão': 0.05, 'Port': 0.15}
+CANAIS = {'SMS': 0.7, 'RCS': 0.3}
+EQUIPES = {'Sales - Time 1': 0.3, 'Sales - Time 2': 0.25, 'Cs Ativação': 0.2, 'Cs App': 0.15, 'Backoffice': 0.1}
+VENDEDORES = [f'Vendedor {numero:02d}' for numero in range(1, 41)]
+MOTIVOS = sorted(MOTIVOS_PRINCIPAIS) + ['Cliente faleceu', 'Duplicado', 'Outro banco']
+DDDS = np.array([11, 21, 27, 31, 41, 44, 51, 62, 71, 79, 81, 82, 83, 85, 86, 92, 98])
+
+# Probabilidade de avançar para a etapa seguinte e dias médios até ela
+FUNIL = [('data_negociacao', 0.45, 2.0), ('data_contratacao', 0.6, 3.0), ('data_pago', 0.8, 5.0)]
+PROB_PERDA = 0.7
+# Mensagens enviadas por lead gerado (vira a Quantidade do gasto)
+MENSAGENS_POR_LEAD = (15, 45)
+
+COLUNA_ORIGINAL = {destino: origem for origem, destino in MAPA_COLUNAS.items()}
+
+
+def _valores(opcoes):
+    return np.array(list(opcoes), dtype=object)
+
+
+def _escolher(rng, opcoes, tamanho):
+    # Sorteio com pesos (dict) ou uniforme (lista); devolve códigos + valores
+    pesos = np.array(list(opcoes.values())) if isinstance(opcoes, dict) else np.ones(len(opcoes))
+    return rng.choice(len(opcoes), tamanho, p=pesos / pesos.sum()), _valores(opcoes)
+
+
+def _pesos_convenios():
+    # Poucos convênios concentram a maior parte dos leads (lei de Zipf)
+    pesos = 1 / np.arange(1, len(CONVENIOS) + 1) ** 0.9
+    return dict(zip(CONVENIOS, pesos))
+
+
+def _pesos_dias(inicio, dias):
+    # Dias úteis com mais volume, sábado pouco, domingo quase nada, e um leve crescimento
+    datas = pd.date_range(inicio, periods=dias, freq='D')
+    pesos = np.select([datas.dayofweek == 5, datas.dayofweek == 6], [0.3, 0.05], 1.0)
+    return pesos * np.linspace(0.8, 1.2, dias)
+
+
+def _formatar_datas(datas):
+    # "AAAA-MM-DDTHH:MM" em C pelo numpy, trocando o "T" por espaço direto nos caracteres
+    # (strftime do pandas seria o passo mais lento da geração)
+    datas = np.asarray(datas, dtype='datetime64[m]')
+    textos = np.datetime_as_string(datas, unit='m')
+    caracteres = textos.view('uint32').reshape(len(textos), -1)
+    caracteres[:, 10] = ord(' ')
+    textos = textos.astype(object)
+    textos[np.isnat(datas)] = None
+    return textos
+
+
+def _cpf(clientes, rng):
+    # 11 dígitos derivados do cliente; metade das linhas vem com máscara
+    numeros = pd.Series((clientes * 7_919 + 10_000_000_000 // 3) % 100_000_000_000).astype(str).str.zfill(11)
+    mascarados = numeros.str[:3] + '.' + numeros.str[3:6] + '.' + numeros.str[6:9] + '-' + numeros.str[9:]
+    return np.where(rng.random(len(clientes)) < 0.5, mascarados, numeros)
+
+
+def _telefone(clientes, rng):
+    # O mesmo cliente costuma ter o mesmo telefone; às vezes chega de outro número
+    trocado = rng.random(len(clientes)) < 0.1
+    base = np.where(trocado, rng.integers(0, 100_000_000, len(clientes)), (clientes * 104_729) % 100_000_000)
+    ddd = pd.Series(DDDS[base % len(DDDS)]).astype(str)
+    numero = pd.Series(base).astype(str).str.zfill(8)
+    formatado = '(' + ddd + ') 9' + numero.str[:4] + '-' + numero.str[4:]
+    return np.where(rng.random(len(clientes)) < 0.5, formatado, ddd + '9' + numero)
+
+
+def gerar_bloco_hubspot(rng, linhas, primeiro_id, inicio, pesos_dias, numero_clientes):
+    # Um bloco da exportação (cabeçalhos originais) + os leads por chave do gasto
+    dias = rng.choice(len(pesos_dias), linhas, p=pesos_dias / pesos_dias.sum())
+    minutos = np.clip(rng.normal(13 * 60, 180, linhas), 0, 24 * 60 - 1).astype('int64')
+    criado = pd.Timestamp(inicio).to_datetime64() + (dias * 1440 + minutos).astype('timedelta64[m]')
+    clientes = rng.integers(0, numero_clientes, linhas)
+
+    codigo_convenio, convenios = _escolher(rng, _pesos_convenios(), linhas)
+    codigo_produto, produtos = _escolher(rng, PRODUTOS, linhas)
+    codigo_canal, canais = _escolher(rng, CANAIS, linhas)
+    codigo_equipe, equipes = _escolher(rng, EQUIPES, linhas)
+    codigo_vendedor, vendedores = _escolher(rng, VENDEDORES, linhas)
+
+    # Funil: cada etapa alcançada tem data depois da anterior; quem para pode ser perdido
+    datas = {'data_lead': np.where(rng.random(linhas) < 0.95, criado, np.datetime64('NaT'))}
+    etapa = np.full(linhas, 'LEAD', dtype=object)
+    ultima = criado.copy()
+    chegou = np.ones(linhas, dtype=bool)
+    for (coluna, probabilidade, dias_medios), nome in zip(FUNIL, ['NEGOCIAÇÃO', 'CONTRATAÇÃO', 'PAGO']):
+        chegou &= rng.random(linhas) < probabilidade
+        ultima = np.where(chegou, ultima + (rng.exponential(dias_medios, linhas) * 1440).astype('timedelta64[m]'), ultima)
+        datas[coluna] = np.where(chegou, ultima, np.datetime64('NaT'))
+        etapa[chegou] = nome
+    perdido = (etapa != 'PAGO') & (rng.random(linhas) < PROB_PERDA)
+    datas['data_perda'] = np.where(perdido, ultima + (rng.exponential(4.0, linhas) * 1440).astype('timedelta64[m]'),
+                                   np.datetime64('NaT'))
+    etapa[perdido] = 'PERDA'
+
+    comissao = np.round(rng.lognormal(6.0, 0.8, linhas), 2)
+    pago = etapa == 'PAGO'
+    valor = np.where(pago, np.round(comissao * rng.uniform(0.7, 1.1, linhas), 2), np.nan)
+    motivo = np.where(perdido, np.array(MOTIVOS, dtype=object)[rng.integers(0, len(MOTIVOS), linhas)], None)
+
+    colunas = {
+        'id': np.arange(primeiro_id, primeiro_id + linhas),
+        'nome': 'Negócio ' + pd.Series(clientes).astype(str),
+        'data_criado': _formatar_datas(criado),
+        'cpf': _cpf(clientes, rng),
+        'telefone': _telefone(clientes, rng),
+        'convenio': convenios[codigo_convenio],
+        'origem': canais[codigo_canal],
+        'tag_campanha': np.array(['camp_' + str(numero) for numero in range(12)], dtype=object)[dias % 12],
+        'vendedor': vendedores[codigo_vendedor],
+        'produto': produtos[codigo_produto],
+        'equipe': equipes[codigo_equipe],
+        'etapa': etapa,
+        'motivo_fechamento': motivo,
+        'comissao_projetada': comissao,
+        'comissao_gerada': valor,
+        'vendedor2': vendedores[codigo_vendedor],
+        'detalhe_perda': np.where(perdido, 'Contato em ' + pd.Series(dias).astype(str), None),
+        **{coluna: _formatar_datas(valores) for coluna, valores in datas.items()},
+    }
+    hubspot = pd.DataFrame({COLUNA_ORIGINAL[destino]: colunas[destino] for destino in MAPA_COLUNAS.values()})
+
+    # Chaves do gasto já normalizadas como o tratamento faria (sigla e equipe)
+    chaves = pd.DataFrame({
+        'dia': dias,
+        'Canal': codigo_canal,
+        'Convênio': codigo_convenio,
+        'Produto': codigo_produto,
+        'Equipe': codigo_equipe,
+    })
+    leads = chaves.value_counts()
+    return hubspot, leads
+
+
+def gerar_gasto(leads, inicio, rng):
+    # Uma linha por dia × canal × convênio × produto × equipe com leads gerados
+    leads = leads.sort_index(level='dia', sort_remaining=False)
+    chaves = leads.index.to_frame(index=False)
+    # Sigla e equipe normalizada calculadas uma vez por valor distinto
+    siglas = _valores(criar_acronimo(convenio) for convenio in CONVENIOS)
+    equipes = _valores(normalizar_equipe(equipe) for equipe in EQUIPES)
+    datas = pd.Timestamp(inicio) + pd.to_timedelta(chaves['dia'], unit='D')
+    quantidade = leads.to_numpy() * rng.integers(*MENSAGENS_POR_LEAD, len(leads))
+    return pd.DataFrame({
+        'Data': datas.dt.strftime('%d/%m/%Y'),
+        'Canal': _valores(CANAIS)[chaves['Canal']],
+        'Quantidade': quantidade,
+        'Convênio': siglas[chaves['Convênio']],
+        'Produto': _valores(PRODUTOS)[chaves['Produto']],
+        'Equipe': equipes[chaves['Equipe']],
+    })
+
+
+def gerar_arquivos(linhas, saida, semente=0, inicio='2024-01-01', dias=365, tamanho_bloco=500_000):
+    # Grava hubspot.csv e gasto.csv em `saida`; devolve os dois caminhos
+    saida = Path(saida)
+    saida.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(semente)
+    pesos_dias = _pesos_dias(inicio, dias)
+    # ~30% dos leads são de clientes que já apareceram antes
+    numero_clientes = max(int(linhas * 0.7), 1)
+
+    caminho_hubspot = saida / 'hubspot.csv'
+    leads = None
+    for primeiro_id in range(0, linhas, tamanho_bloco):
+        tamanho = min(tamanho_bloco, linhas - primeiro_id)
+        bloco, leads_bloco = gerar_bloco_hubspot(rng, tamanho, primeiro_id, inicio, pesos_dias, numero_clientes)
+        bloco.to_csv(caminho_hubspot, mode='w' if primeiro_id == 0 else 'a', header=primeiro_id == 0, index=False)
+        leads = leads_bloco if leads is None else leads.add(leads_bloco, fill_value=0)
+
+    caminho_gasto = saida / 'gasto.csv'
+    gerar_gasto(leads.astype('int64'), inicio, rng).to_csv(caminho_gasto, sep=';', index=False)
+    return caminho_hubspot, caminho_gasto
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, default=100_000, help='Linhas da exportação do HubSpot')
+    parser.add_argument('--saida', default='dados_sinteticos')
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--inicio', default='2024-01-01', help='Primeiro dia de criação dos leads')
+    parser.add_argument('--dias', type=int, default=365, help='Quantidade de dias cobertos')
+    parser.add_argument('--tamanho-bloco', type=int, default=500_000)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    for caminho in gerar_arquivos(args.linhas, args.saida, args.semente, args.inicio, args.dias, args.tamanho_bloco):
+        print(f'{caminho} ({caminho.stat().st_size / 1024 ** 2:,.1f} MB)')
+    print(f'{time.perf_counter() - inicio:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
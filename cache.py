@@ -0,0 +1,219 @@
+import hashlib
+import os
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+
+# Todos os caches do processo, para `esquecer` os objetos de um dataset descartado
+_caches = weakref.WeakSet()
+
+
+# Leitura de arquivos para o hash em pedaços deste tamanho
+BLOCO_HASH = 1024 ** 2
+
+
+def hash_conteudo(*partes):
+    # Hash estável de bytes/strings, usado como chave dos caches. Um os.PathLike entra pelo
+    # conteúdo do arquivo, lido em pedaços (mesmo hash que os bytes dele)
+    h = hashlib.sha256()
+    for parte in partes:
+        if isinstance(parte, os.PathLike):
+            h.update(str(os.path.getsize(parte)).encode('ascii') + b':')
+            with open(parte, 'rb') as arquivo:
+                for pedaco in iter(lambda: arquivo.read(BLOCO_HASH), b''):
+                    h.update(pedaco)
+            continue
+        if isinstance(parte, str):
+            parte = parte.encode('utf-8')
+        h.update(str(len(parte)).encode('ascii') + b':')
+        h.update(parte)
+    return h.hexdigest()
+
+
+def tamanho_objeto(valor):
+    # Tamanho aproximado em bytes (DataFrames usam memory_usage)
+    if hasattr(valor, 'memory_usage'):
+        uso = valor.memory_usage(deep=True)
+        return int(uso.sum()) if hasattr(uso, 'sum') else int(uso)
+    return sys.getsizeof(valor)
+
+
+class CacheLRU:
+    """Cache LRU com limite de entradas e de bytes, e contadores de acertos/falhas.
+
+    Fica no nível do módulo, então sobrevive aos reruns do Streamlit.
+    """
+
+    def __init__(self, max_entradas=8, max_bytes=None, medir_tamanho=tamanho_objeto):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.medir_tamanho = medir_tamanho
+        self._itens = OrderedDict()
+        self._tamanhos = {}
+        self._lock = threading.Lock()
+        self.bytes_usados = 0
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes = 0
+        _caches.add(self)
+
+    def __contains__(self, chave):
+        with self._lock:
+            return chave in self._itens
+
+    def __len__(self):
+        return len(self._itens)
+
+    def obter(self, chave, padrao=None):
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._itens[chave]
+            self.falhas += 1
+            return padrao
+
+    def guardar(self, chave, valor):
+        tamanho = self.medir_tamanho(valor)
+        with self._lock:
+            if chave in self._itens:
+                self.bytes_usados -= self._tamanhos.pop(chave)
+                del self._itens[chave]
+            self._itens[chave] = valor
+            self._tamanhos[chave] = tamanho
+            self.bytes_usados += tamanho
+            self._remover_excedentes()
+        return valor
+
+    def obter_ou_calcular(self, chave, funcao):
+        # O cálculo roda fora do lock: duas sessões podem calcular a mesma chave,
+        # mas nenhuma fica bloqueada esperando a outra
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._itens[chave]
+            self.falhas += 1
+        return self.guardar(chave, funcao())
+
+    def _remover_excedentes(self):
+        # Mantém ao menos a entrada mais recente, mesmo que sozinha passe do limite
+        while len(self._itens) > 1 and (
+            len(self._itens) > self.max_entradas
+            or (self.max_bytes and self.bytes_usados > self.max_bytes)
+        ):
+            chave, _ = self._itens.popitem(last=False)
+            self.bytes_usados -= self._tamanhos.pop(chave)
+            self.remocoes += 1
+
+    def itens(self):
+        with self._lock:
+            return list(self._itens.items())
+
+    def remover(self, chaves):
+        with self._lock:
+            for chave in chaves:
+                if chave in self._itens:
+                    del self._itens[chave]
+                    self.bytes_usados -= self._tamanhos.pop(chave)
+                    self.remocoes += 1
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._tamanhos.clear()
+            self.bytes_usados = 0
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        return {
+            'entradas': len(self._itens),
+            'max_entradas': self.max_entradas,
+            'mb_usados': round(self.bytes_usados / 1024 ** 2, 1),
+            'max_mb': round(self.max_bytes / 1024 ** 2, 1) if self.max_bytes else None,
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'remocoes': self.remocoes,
+            'taxa_acerto': round(self.acertos / total * 100, 1) if total else 0.0,
+        }
+
+
+def memoizar_por_objetos(cache, objetos, funcao):
+    # Chave pela identidade dos objetos (ex.: o DataFrame que está no cache de ingestão);
+    # eles ficam guardados junto do resultado, então o id não é reaproveitado enquanto
+    # a entrada existir
+    chave = tuple(id(objeto) for objeto in objetos)
+    _, resultado = cache.obter_ou_calcular(chave, lambda: (tuple(objetos), funcao()))
+    return resultado
+
+
+def _memoizado(chave, valor):
+    return (isinstance(valor, tuple) and len(valor) == 2 and isinstance(valor[0], tuple)
+            and chave == tuple(id(objeto) for objeto in valor[0]))
+
+
+def _objetos_medidos(valor):
+    # Objetos com memory_usage (frames, cubos, índices, motores) dentro de uma chave ou
+    # valor de cache, abrindo tuplas, listas e dicts
+    if isinstance(valor, (tuple, list)):
+        for item in valor:
+            yield from _objetos_medidos(item)
+    elif isinstance(valor, dict):
+        yield from _objetos_medidos(list(valor.values()))
+    elif hasattr(valor, 'memory_usage') and not isinstance(valor, type):
+        yield valor
+
+
+def _fecho(entradas, origem, sentido, bloqueados=frozenset()):
+    # Objetos (ids) ligados a `origem` pelas entradas (ids da chave, ids do valor): sentido 1
+    # segue chave -> valor (o que foi calculado a partir deles), -1 valor -> chave (de onde
+    # vieram). Os `bloqueados` não entram nem são atravessados
+    fecho = set(origem) - bloqueados
+    mudou = True
+    while mudou:
+        mudou = False
+        for chave, valor in entradas:
+            de, para = (chave, valor) if sentido == 1 else (valor, chave)
+            novos = para - fecho - bloqueados
+            if novos and de & fecho:
+                fecho |= novos
+                mudou = True
+    return fecho
+
+
+def esquecer(descartados, em_uso=()):
+    """Tira de todos os caches as entradas dos datasets `descartados` (motores ou frames).
+
+    Os caches memoizados por identidade guardam os objetos de cada dataset (o frame de
+    onde um cubo saiu, o cubo na chave das agregações): sem isso, um dataset descartado
+    do registro continuaria na memória até as entradas saírem pelo LRU. Saem as entradas
+    com objetos do dataset, de onde ele veio ou do que foi calculado a partir dele;
+    objetos que também servem a um dataset `em_uso` (ex.: o mesmo arquivo de gasto) ficam.
+    """
+    def raizes(datasets):
+        # O dataset e os objetos que ele guarda em atributos (frames, cubos, índice)
+        ids = set()
+        for dataset in datasets:
+            ids.add(id(dataset))
+            if hasattr(dataset, '__dict__'):
+                ids.update(id(objeto) for objeto in _objetos_medidos(list(vars(dataset).values())))
+        return ids
+
+    caches = list(_caches)
+    itens = {cache: cache.itens() for cache in caches}
+    entradas = []
+    for cache in caches:
+        for chave, valor in itens[cache]:
+            if _memoizado(chave, valor):
+                # memoizar_por_objetos: chave = ids, valor = (objetos da chave, resultado)
+                chave, valor = valor
+            entradas.append(({id(objeto) for objeto in _objetos_medidos(chave)},
+                             {id(objeto) for objeto in _objetos_medidos(valor)}))
+    usados = raizes(em_uso)
+    preservados = _fecho(entradas, usados, -1) | _fecho(entradas, usados, 1)
+    origens = _fecho(entradas, raizes(descartados), -1, preservados)
+    alvos = _fecho(entradas, origens, 1, preservados)
+    entradas = iter(entradas)
+    for cache in caches:
+        cache.remover([chave for chave, _ in itens[cache] if alvos & set.union(*next(entradas))])
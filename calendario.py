@@ -0,0 +1,148 @@
+from datetime import date, timedelta
+from functools import lru_cache
+
+import numpy as np
+
+# Tabela pré-calculada de dias úteis, estendida aos anos dos dados (fora dela, os feriados
+# dos anos pedidos são calculados na hora)
+ANO_INICIAL = 2015
+ANO_FINAL = 2040
+
+# Feriados nacionais de data fixa (mês, dia)
+FERIADOS_NACIONAIS = [
+    (1, 1),    # Confraternização Universal
+    (4, 21),   # Tiradentes
+    (5, 1),    # Dia do Trabalho
+    (9, 7),    # Independência
+    (10, 12),  # Nossa Senhora Aparecida
+    (11, 2),   # Finados
+    (11, 15),  # Proclamação da República
+    (12, 25),  # Natal
+]
+
+# Feriados nacionais de data fixa criados depois de ANO_INICIAL: ((mês, dia), primeiro ano)
+FERIADOS_NACIONAIS_DESDE = [
+    ((11, 20), 2024),  # Consciência Negra (Lei 14.759/2023)
+]
+
+# Feriados móveis, em dias a partir do domingo de Páscoa
+FERIADOS_MOVEIS = [
+    -48,  # Segunda de Carnaval
+    -47,  # Terça de Carnaval
+    -2,   # Sexta-feira Santa
+    60,   # Corpus Christi
+]
+
+# Feriados estaduais de data fixa, por UF; editar aqui para incluir outros
+FERIADOS_ESTADUAIS = {
+    'AL': [(6, 24), (6, 29), (9, 16)],
+    'AM': [(9, 5)],
+    'BA': [(7, 2)],
+    'CE': [(3, 19), (3, 25)],
+    'MA': [(7, 28)],
+    'MS': [(10, 11)],
+    'PB': [(8, 5)],
+    'PE': [(3, 6)],
+    'PI': [(10, 19)],
+    'PR': [(12, 19)],
+    'RJ': [(4, 23)],
+    'RO': [(1, 4), (6, 18)],
+    'SP': [(7, 9)],
+}
+
+
+def pascoa(ano):
+    # Algoritmo de Meeus/Jones/Butcher (calendário gregoriano)
+    a, b, c = ano % 19, ano // 100, ano % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes = (h + l - 7 * m + 114) // 31
+    dia = (h + l - 7 * m + 114) % 31 + 1
+    return date(ano, mes, dia)
+
+
+def feriados(uf=None, ano_inicial=ANO_INICIAL, ano_final=ANO_FINAL):
+    fixos = FERIADOS_NACIONAIS + FERIADOS_ESTADUAIS.get(uf, [])
+    datas = set()
+    for ano in range(ano_inicial, ano_final + 1):
+        datas.update(date(ano, mes, dia) for mes, dia in fixos)
+        datas.update(date(ano, mes, dia) for (mes, dia), desde in FERIADOS_NACIONAIS_DESDE if ano >= desde)
+        domingo_pascoa = pascoa(ano)
+        datas.update(domingo_pascoa + timedelta(days=deslocamento) for deslocamento in FERIADOS_MOVEIS)
+    return np.array(sorted(datas), dtype='datetime64[D]')
+
+
+class Calendario:
+    """Calendário de dias úteis (segunda a sexta, menos feriados) com tabela pré-calculada.
+
+    Guarda, para cada dia de ano_inicial a ano_final, se é útil e a contagem acumulada
+    de dias úteis; "é dia útil?" e "quantos dias úteis entre duas datas" viram consultas
+    por índice, vetorizadas e O(1) por data. Datas fora da tabela usam os feriados dos
+    anos delas.
+    """
+
+    def __init__(self, uf=None, ano_inicial=ANO_INICIAL, ano_final=ANO_FINAL):
+        self.uf = uf
+        self.feriados = feriados(uf, ano_inicial, ano_final)
+        self.calendario_numpy = np.busdaycalendar(holidays=self.feriados)
+        self.inicio = np.datetime64(f'{ano_inicial}-01-01', 'D')
+        dias = np.arange(self.inicio, np.datetime64(f'{ano_final + 1}-01-01', 'D'))
+        self.tabela_util = np.is_busday(dias, busdaycal=self.calendario_numpy)
+        # acumulado[i] = dias úteis em [inicio, inicio + i)
+        self.acumulado = np.concatenate([[0], np.cumsum(self.tabela_util)])
+
+    def eh_dia_util(self, datas):
+        # datas: array/Series de datetime64; NaT não é dia útil
+        dias = np.asarray(datas, dtype='datetime64[D]')
+        posicoes = (dias - self.inicio).astype('int64')
+        dentro = (posicoes >= 0) & (posicoes < len(self.tabela_util)) & ~np.isnat(dias)
+        resultado = np.zeros(dias.shape, dtype=bool)
+        resultado[dentro] = self.tabela_util[posicoes[dentro]]
+        fora = ~dentro & ~np.isnat(dias)
+        if fora.any():
+            resultado[fora] = np.is_busday(dias[fora], busdaycal=self._calendario_dos_anos(dias[fora]))
+        return resultado
+
+    def dias_uteis_entre(self, inicio, fim):
+        # Quantidade de dias úteis no intervalo fechado [inicio, fim]
+        inicio, fim = np.datetime64(inicio, 'D'), np.datetime64(fim, 'D')
+        if fim < inicio:
+            return 0
+        a, b = int((inicio - self.inicio).astype('int64')), int((fim - self.inicio).astype('int64')) + 1
+        if 0 <= a and b <= len(self.tabela_util):
+            return int(self.acumulado[b] - self.acumulado[a])
+        return int(np.busday_count(inicio, fim + 1, busdaycal=self._calendario_dos_anos([inicio, fim])))
+
+    def _calendario_dos_anos(self, dias):
+        anos = [_ano(dia) for dia in dias]
+        return _calendario_numpy(self.uf, min(anos), max(anos))
+
+
+def _ano(data):
+    # Ano de uma data (datetime64, Timestamp, date); None para ausente (None ou NaT)
+    if data is None or data != data:
+        return None
+    return int(np.datetime64(data, 'D').astype('datetime64[Y]').astype('int64')) + 1970
+
+
+@lru_cache(maxsize=32)
+def _calendario_numpy(uf, ano_inicial, ano_final):
+    # Feriados de anos fora da tabela (a Páscoa de cada ano calculada na hora)
+    return np.busdaycalendar(holidays=feriados(uf, ano_inicial, ano_final))
+
+
+@lru_cache(maxsize=None)
+def _calendario(uf, ano_inicial, ano_final):
+    return Calendario(uf, ano_inicial, ano_final)
+
+
+def calendario(uf=None, *datas):
+    # Uma instância por UF, compartilhada entre sessões e reruns. A tabela vai de ANO_INICIAL
+    # a ANO_FINAL, estendida aos anos das `datas` (ex.: o período dos dados) fora dela
+    anos = [ano for ano in map(_ano, datas) if ano is not None]
+    return _calendario(uf or None, min([ANO_INICIAL, *anos]), max([ANO_FINAL, *anos]))
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+from cache import CacheLRU, memoizar_por_objetos
+from tratamento import COLUNAS_DATA_ETAPA
+
+# Agrupamento das datas de entrada: rótulo na tela -> unidade do cohort
+AGRUPAMENTOS = {'Dia': 'D', 'Semana': 'W', 'Mês': 'M'}
+
+# Data de entrada + datas das etapas (eventos do cohort)
+COLUNAS_COHORT = ['data'] + COLUNAS_DATA_ETAPA
+
+# Data ausente no vetor de dias inteiros
+SEM_DATA = np.iinfo('int64').min
+
+
+class DiasDataset:
+    """Colunas de data de um dataset convertidas uma vez para dias inteiros desde a época.
+
+    Os cohorts trabalham só com esses vetores (mais as posições das linhas filtradas),
+    sem copiar o DataFrame nem converter datas a cada rerun.
+    """
+
+    def __init__(self, dataframe, colunas):
+        self.dias = {}
+        for coluna in colunas:
+            if coluna in dataframe.columns:
+                datas = dataframe[coluna].to_numpy(dtype='datetime64[D]')
+                dias = datas.astype('int64')
+                dias[np.isnat(datas)] = SEM_DATA
+                self.dias[coluna] = dias
+
+    def memory_usage(self, deep=True):
+        return sum(dias.nbytes for dias in self.dias.values())
+
+
+cache_dias = CacheLRU(max_entradas=8)
+
+
+def dias_dataset(dataframe):
+    return memoizar_por_objetos(cache_dias, [dataframe], lambda: DiasDataset(dataframe, COLUNAS_COHORT))
+
+
+def _inicio_do_grupo(dias, agrupamento):
+    # Dia inicial do cohort de cada entrada (semana começa na segunda)
+    if agrupamento == 'W':
+        # 1970-01-01 foi quinta-feira: (dias + 3) % 7 = dia da semana com segunda = 0
+        return dias - (dias + 3) % 7
+    if agrupamento == 'M':
+        return dias.astype('datetime64[D]').astype('datetime64[M]').astype('datetime64[D]').astype('int64')
+    return dias
+
+
+class MatrizCohort:
+    """Matriz densa cohort × dias até o evento (0 a horizonte), com o tamanho de cada cohort."""
+
+    def __init__(self, cohorts, tamanhos, eventos):
+        self.cohorts = cohorts
+        self.tamanhos = tamanhos
+        self.eventos = eventos
+
+    def memory_usage(self, deep=True):
+        return self.eventos.nbytes + self.tamanhos.nbytes
+
+    def taxas(self, acumulada=False):
+        # Percentual do cohort que teve o evento em cada dia (ou até cada dia)
+        eventos = np.cumsum(self.eventos, axis=1) if acumulada else self.eventos
+        return eventos / self.tamanhos[:, None] * 100
+
+
+def montar_cohort(dias_entrada, dias_evento, horizonte, agrupamento='D'):
+    com_entrada = dias_entrada != SEM_DATA
+    dias_entrada, dias_evento = dias_entrada[com_entrada], dias_evento[com_entrada]
+
+    grupos, codigos = np.unique(_inicio_do_grupo(dias_entrada, agrupamento), return_inverse=True)
+    tamanhos = np.bincount(codigos, minlength=len(grupos))
+
+    # Eventos antes da entrada (dado inconsistente) ou depois do horizonte ficam de fora
+    deslocamento = dias_evento - dias_entrada
+    validos = (dias_evento != SEM_DATA) & (deslocamento >= 0) & (deslocamento <= horizonte)
+    largura = horizonte + 1
+    celulas = codigos[validos] * largura + deslocamento[validos]
+    eventos = np.bincount(celulas, minlength=len(grupos) * largura).reshape(len(grupos), largura)
+
+    cohorts = pd.DatetimeIndex(grupos.astype('datetime64[D]').astype('datetime64[ns]'))
+    return MatrizCohort(cohorts, tamanhos, eventos)
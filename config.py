@@ -0,0 +1,69 @@
+import os
+
+# Configurações lidas de variáveis de ambiente (com valores padrão)
+
+
+def _int_env(nome, padrao):
+    try:
+        return int(os.environ.get(nome, padrao))
+    except ValueError:
+        return padrao
+
+
+# Cache de ingestão: quantos arquivos processados manter (um ano de exportações mensais
+# cabe) e limite de memória (MB)
+CACHE_INGESTAO_MAX_ENTRADAS = _int_env('HUBSPOT_CACHE_MAX_ENTRADAS', 32)
+CACHE_INGESTAO_MAX_MB = _int_env('HUBSPOT_CACHE_MAX_MB', 2048)
+
+# Guardar as colunas de dimensão (equipe, produto, convênio...) como category
+DIMENSOES_CATEGORICAS = _int_env('HUBSPOT_DIMENSOES_CATEGORICAS', 1) == 1
+
+# Arquivos do HubSpot acima deste tamanho (MB) são lidos em blocos, só com as colunas usadas.
+# Do disco (relatorio.py, MotorMetricas.de_arquivos) o pico fica no bloco + resultado; no
+# painel os bytes do envio já estão na memória (o Streamlit aceita até 200 MB por padrão),
+# e os blocos evitam o frame bruto com todas as colunas
+STREAMING_ACIMA_MB = _int_env('HUBSPOT_STREAMING_ACIMA_MB', 50)
+TAMANHO_BLOCO = _int_env('HUBSPOT_TAMANHO_BLOCO', 100_000)
+
+# Base local em Parquet com o histórico já tratado (0 desliga)
+USAR_BASE_LOCAL = _int_env('HUBSPOT_BASE_LOCAL', 1) == 1
+DIR_BASE_LOCAL = os.environ.get('HUBSPOT_DIR_BASE', '.base_hubspot')
+
+# Cache das agregações por estado de filtro (entradas são frames pequenos)
+CACHE_AGREGACOES_MAX_ENTRADAS = _int_env('HUBSPOT_CACHE_AGREGACOES_MAX_ENTRADAS', 256)
+CACHE_AGREGACOES_MAX_MB = _int_env('HUBSPOT_CACHE_AGREGACOES_MAX_MB', 256)
+
+# UF cujos feriados estaduais entram no calendário de dias úteis (vazio = só nacionais)
+UF_FERIADOS = os.environ.get('HUBSPOT_UF_FERIADOS', '').strip().upper()
+
+# Horizonte padrão (dias após a entrada) da matriz de cohort
+COHORT_HORIZONTE_DIAS = _int_env('HUBSPOT_COHORT_HORIZONTE_DIAS', 90)
+
+# Figuras Plotly já montadas, reaproveitadas enquanto as entradas do gráfico não mudam
+CACHE_GRAFICOS_MAX_ENTRADAS = _int_env('HUBSPOT_CACHE_GRAFICOS_MAX_ENTRADAS', 64)
+
+# Instrumentação (0 desliga): tempo e pico de memória por etapa de cada rerun, em JSON lines
+INSTRUMENTACAO = _int_env('HUBSPOT_INSTRUMENTACAO', 0) == 1
+INSTRUMENTACAO_MEMORIA = _int_env('HUBSPOT_INSTRUMENTACAO_MEMORIA', 1) == 1
+ARQUIVO_INSTRUMENTACAO = os.environ.get('HUBSPOT_ARQUIVO_INSTRUMENTACAO', 'instrumentacao.jsonl')
+# cProfile de todo rerun (também dá para ligar só no próximo pela barra lateral)
+PERFIL_CPROFILE = _int_env('HUBSPOT_CPROFILE', 0) == 1
+DIR_PERFIS = os.environ.get('HUBSPOT_DIR_PERFIS', 'perfis')
+
+# Processos para ler e tratar vários arquivos enviados de uma vez (1 = tudo no processo do app)
+PROCESSOS_INGESTAO = _int_env('HUBSPOT_PROCESSOS_INGESTAO', os.cpu_count() or 1)
+
+# Datasets sem nenhuma sessão usando que continuam no registro compartilhado (os em uso
+# nunca são descartados)
+DATASETS_OCIOSOS = _int_env('HUBSPOT_DATASETS_OCIOSOS', 2)
+
+# Janela (dias) dos leads duplicados: mesmo CPF ou telefone de um lead criado até N dias antes
+JANELA_DUPLICADOS_DIAS = _int_env('HUBSPOT_JANELA_DUPLICADOS_DIAS', 30)
+
+# Backend das consultas, escolhido na subida do app: "pandas" (tudo em memória), "duckdb"
+# (histórico da base local num banco DuckDB em disco, para dados maiores que a memória) ou
+# "polars" (consultas lazy do Polars em todos os núcleos; POLARS_MAX_THREADS limita)
+BACKEND = os.environ.get('HUBSPOT_BACKEND', 'pandas').strip().lower()
+DUCKDB_MEMORIA_MB = _int_env('HUBSPOT_DUCKDB_MEMORIA_MB', 1024)
+# Pasta dos bancos temporários do DuckDB (vazio = pasta temporária do sistema)
+DIR_DUCKDB = os.environ.get('HUBSPOT_DIR_DUCKDB', '')
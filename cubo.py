@@ -0,0 +1,95 @@
+from cache import CacheLRU, memoizar_por_objetos
+from distintos import EsbocosDistintos
+from filtros import DIMENSOES_GASTO, DIMENSOES_HUBSPOT, IndiceFiltros
+from quantis import EsbocosQuantis
+from tratamento import COLUNAS_DATA_ETAPA
+
+# Chaves do cubo do HubSpot. O motivo bruto divide as células de perda que o agrupado
+# junta em 'Outros' (o agrupado não acrescenta nada além dele): são mais células
+# (~2% nos dados de benchmarks/gerar_dados.py), mas o painel dos motivos mais comuns sai do
+# cubo em vez de varrer os leads. Com data e cinco dimensões o cubo já fica perto do número
+# de linhas quando os dados são esparsos (80% em 500 mil linhas sintéticas); o ganho vem
+# de exportações com muitos leads por dia e combinação. duplicado permite tirar os leads
+# repetidos de todos os painéis
+CHAVES_CUBO = ['data', 'equipe', 'produto', 'convenio_acronimo', 'etapa', 'origem',
+               'motivo_fechamento', 'motivo_fechamento_agrupado', 'duplicado']
+CHAVES_CUBO_GASTO = ['data'] + DIMENSOES_GASTO
+
+# Etapas do funil: coluna de data -> medida com a quantidade de datas preenchidas
+MEDIDAS_FUNIL = {
+    'data': 'n_lead',
+    'data_negociacao': 'n_negociacao',
+    'data_contratacao': 'n_contratacao',
+    'data_pago': 'n_pago',
+    'data_perda': 'n_perda',
+}
+
+# Colunas que os painéis consultam (as que os backends fora do pandas leem da base local);
+# duplicado não está na base, é calculado sobre o dataset inteiro (duplicados.py)
+COLUNAS_HUBSPOT = (['id'] + [chave for chave in CHAVES_CUBO if chave != 'duplicado']
+                   + ['comissao_gerada', 'comissao_projetada'] + COLUNAS_DATA_ETAPA
+                   + ['registro_cpf', 'posto_cpf', 'cpf', 'telefone', 'horario_criado'])
+COLUNAS_GASTO = CHAVES_CUBO_GASTO + ['Quantidade', 'Valor Gasto']
+
+
+def montar_cubo(dataframe):
+    # Uma linha por combinação de chaves com contagens e somas; nulos viram células próprias.
+    # Devolve também a célula de cada linha (mesma ordem do groupby, sort=False)
+    medidas = {
+        'leads': 1,
+        'ids': dataframe['id'].notna(),
+        'comissao_gerada': dataframe['comissao_gerada'],
+        'comissao_projetada': dataframe['comissao_projetada'],
+    }
+    for coluna, medida in MEDIDAS_FUNIL.items():
+        medidas[medida] = dataframe[coluna].notna()
+    agrupado = dataframe[CHAVES_CUBO].assign(**medidas).groupby(CHAVES_CUBO, observed=True, dropna=False, sort=False)
+    return agrupado.sum().reset_index(), agrupado.ngroup().to_numpy()
+
+
+def montar_cubo_gasto(dataframe):
+    cubo = dataframe[CHAVES_CUBO_GASTO + ['Quantidade', 'Valor Gasto']]
+    return cubo.groupby(CHAVES_CUBO_GASTO, observed=True, dropna=False, sort=False).sum().reset_index()
+
+
+class Cubo:
+    """Cubo agregado + índice de filtros sobre as suas células.
+
+    Os filtros da barra lateral são os mesmos do DataFrame bruto, mas aplicados às
+    células, então o custo de cada rerun depende do número de células, não de leads.
+    `esbocos` e `distintos` (opcionais) guardam os esboços de quantis e de clientes
+    distintos por célula.
+    """
+
+    def __init__(self, celulas, dimensoes, esbocos=None, distintos=None):
+        self.celulas = celulas
+        self.indice = IndiceFiltros(celulas, dimensoes)
+        self.esbocos = esbocos
+        self.distintos = distintos
+
+    def memory_usage(self, deep=True):
+        partes = [self.indice, self.esbocos, self.distintos]
+        return int(self.celulas.memory_usage(deep=deep).sum()) + sum(
+            parte.memory_usage(deep=deep) for parte in partes if parte is not None)
+
+    def filtrar(self, selecao, inicio=None, fim=None, calendario=None):
+        return self.celulas.take(self.indice.posicoes(selecao, inicio, fim, calendario))
+
+
+cache_cubos = CacheLRU(max_entradas=8)
+
+
+def cubo_hubspot(dataframe):
+    def montar():
+        celulas, celula_por_linha = montar_cubo(dataframe)
+        # Esboço da comissão projetada por célula, para o boxplot
+        esbocos = EsbocosQuantis(celula_por_linha, dataframe['comissao_projetada'], len(celulas))
+        # Esboço dos CPFs por célula, para os clientes únicos
+        distintos = EsbocosDistintos(celula_por_linha, dataframe['registro_cpf'].to_numpy(),
+                                     dataframe['posto_cpf'].to_numpy(), len(celulas))
+        return Cubo(celulas, DIMENSOES_HUBSPOT, esbocos, distintos)
+    return memoizar_por_objetos(cache_cubos, [dataframe], montar)
+
+
+def cubo_gasto(dataframe):
+    return memoizar_por_objetos(cache_cubos, [dataframe], lambda: Cubo(montar_cubo_gasto(dataframe), DIMENSOES_GASTO))
@@ -0,0 +1,99 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+# Acima disso o cache é esvaziado (as exportações repetem poucos milhares de valores)
+MAX_VALORES_CACHE = 1_000_000
+
+
+class ParserDatas:
+    """Converte colunas de texto em datetime64 analisando cada string distinta uma única vez.
+
+    O formato é detectado na primeira amostra e travado; os resultados ficam num cache
+    compartilhado entre colunas e arquivos e voltam para as linhas pelos códigos do
+    factorize. Se o formato travado não reconhecer nenhum valor de um lote novo (outra
+    exportação), o formato é detectado de novo.
+    """
+
+    def __init__(self, dayfirst=False):
+        self.dayfirst = dayfirst
+        self.formato = None
+        # Cache: strings já vistas (Index com tabela hash) -> nanossegundos desde a época
+        self._chaves = pd.Index([], dtype=object)
+        self._valores = np.empty(0, dtype='int64')
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def _detectar_formato(self, valores):
+        for valor in valores[:50]:
+            formato = guess_datetime_format(valor, dayfirst=self.dayfirst)
+            if formato:
+                return formato
+        return None
+
+    def _analisar(self, valores):
+        if self.formato is None:
+            self.formato = self._detectar_formato(valores)
+        convertidos = self._converter_texto(valores, self.formato)
+        if convertidos.isna().all():
+            formato = self._detectar_formato(valores)
+            if formato and formato != self.formato:
+                self.formato = formato
+                convertidos = self._converter_texto(valores, formato)
+        return convertidos
+
+    def _converter_texto(self, valores, formato):
+        convertidos = pd.to_datetime(pd.Index(valores, dtype=object), format=formato,
+                                     dayfirst=self.dayfirst, errors='coerce')
+        if convertidos.tz is not None:
+            # Mantém o horário como aparece na exportação
+            convertidos = convertidos.tz_localize(None)
+        return convertidos
+
+    def converter(self, serie):
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codigos, unicos = serie.cat.codes.to_numpy(), pd.Index(serie.cat.categories, dtype=object)
+        else:
+            codigos, unicos = pd.factorize(serie)
+            unicos = pd.Index(unicos, dtype=object)
+
+        with self._lock:
+            posicoes = self._chaves.get_indexer(unicos)
+            faltando = posicoes == -1
+            self.acertos += int((~faltando).sum())
+            self.falhas += int(faltando.sum())
+            if faltando.any():
+                novos = unicos[faltando]
+                if len(self._chaves) + len(novos) > MAX_VALORES_CACHE:
+                    self._chaves = pd.Index([], dtype=object)
+                    self._valores = np.empty(0, dtype='int64')
+                    posicoes[:] = -1
+                    faltando[:] = True
+                    novos = unicos
+                inicio = len(self._chaves)
+                self._chaves = self._chaves.append(novos)
+                self._valores = np.concatenate([self._valores, self._analisar(list(novos)).asi8])
+                posicoes[faltando] = np.arange(inicio, inicio + len(novos))
+            valores = self._valores[posicoes]
+
+        # Última posição = NaT, para onde vai o código -1 (valor ausente)
+        valores = np.append(valores, np.iinfo('int64').min).view('datetime64[ns]')
+        return pd.Series(valores[codigos], index=serie.index, name=serie.name)
+
+    def limpar(self):
+        with self._lock:
+            self.formato = None
+            self._chaves = pd.Index([], dtype=object)
+            self._valores = np.empty(0, dtype='int64')
+
+    def estatisticas(self):
+        return {'formato': self.formato, 'valores_em_cache': len(self._chaves),
+                'acertos': self.acertos, 'falhas': self.falhas}
+
+
+# Instâncias compartilhadas entre colunas, arquivos e reruns
+parser_hubspot = ParserDatas()
+parser_gasto = ParserDatas(dayfirst=True)
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+import config
+from cache import CacheLRU, memoizar_por_objetos
+
+# Chaves do cliente: o mesmo valor normalizado (tratamento.normalizar_cpf/_telefone) é a
+# mesma pessoa, em qualquer campanha ou origem
+CHAVES_CLIENTE = ['cpf', 'telefone']
+
+
+def janela_ns(dias=None):
+    return int((config.JANELA_DUPLICADOS_DIAS if dias is None else dias) * 86_400 * 10 ** 9)
+
+
+def instantes_ns(dataframe):
+    # Data + horário de criação em ns (NaT = mínimo do int64, tratado como ausente)
+    return (dataframe['data'] + dataframe['horario_criado']).to_numpy(dtype='datetime64[ns]').view('int64')
+
+
+def duplicados(dataframe, dias=None):
+    """Marca os leads que repetem o CPF ou o telefone de um lead criado até `dias` antes.
+
+    Uma ordenação por instante de criação (estável: empates na ordem das linhas) e, por
+    chave, um índice hash (factorize) que dá o lead anterior da mesma pessoa em tempo
+    linear (shift por grupo). A janela conta a partir do lead anterior, então uma
+    sequência de entradas próximas fica toda marcada, menos a primeira. Sem data ou sem
+    a chave, o lead não é duplicado por ela.
+    """
+    instantes = instantes_ns(dataframe)
+    validos = instantes != np.iinfo('int64').min
+    ordem = np.argsort(np.where(validos, instantes, np.iinfo('int64').max), kind='stable')
+    ordenados, validos = instantes[ordem], validos[ordem]
+    marcados = np.zeros(len(dataframe), dtype=bool)
+    for coluna in CHAVES_CLIENTE:
+        codigos, _ = pd.factorize(dataframe[coluna].take(ordem))
+        codigos = np.where(validos, codigos, -1)
+        # Posição (na ordem por instante) do lead anterior com a mesma chave
+        anterior = pd.Series(np.arange(len(ordem))).groupby(codigos).shift().to_numpy()
+        com_anterior = (codigos >= 0) & ~np.isnan(anterior)
+        posicoes = np.flatnonzero(com_anterior)
+        perto = ordenados[posicoes] - ordenados[anterior[posicoes].astype('int64')] <= janela_ns(dias)
+        marcados[ordem[posicoes[perto]]] = True
+    return marcados
+
+
+cache_duplicados = CacheLRU(max_entradas=4)
+
+
+def marcar_duplicados(dataframe):
+    # Dataset com a coluna `duplicado`; memoizado pela identidade do frame, para os
+    # índices e cubos por dataset continuarem valendo
+    return memoizar_por_objetos(cache_duplicados, [dataframe],
+                                lambda: dataframe.assign(duplicado=duplicados(dataframe)))
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+from cache import CacheLRU, memoizar_por_objetos
+
+
+class IndiceFiltros:
+    """Índice montado uma vez por dataset para aplicar os filtros da barra lateral.
+
+    Cada dimensão vira um vetor de códigos inteiros + dicionário de valores, e a data
+    um vetor int64 ordenado (com a permutação das linhas). Uma seleção é então uma só
+    máscara booleana: busca binária no intervalo de datas e, por dimensão, uma tabela
+    "código permitido?" indexada pelos códigos. Nenhum DataFrame intermediário é criado.
+    """
+
+    def __init__(self, dataframe, dimensoes, coluna_data='data'):
+        self.tamanho = len(dataframe)
+        self.codigos = {}
+        self.valores = {}
+        for dimensao in dimensoes:
+            serie = dataframe[dimensao]
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                codigos, categorias = serie.cat.codes.to_numpy(), serie.cat.categories
+            else:
+                codigos, categorias = pd.factorize(serie)
+                categorias = pd.Index(categorias)
+            self.codigos[dimensao] = codigos
+            self.valores[dimensao] = categorias
+
+        datas = dataframe[coluna_data].to_numpy(dtype='datetime64[ns]')
+        self.ordem_datas = np.argsort(datas.view('int64'), kind='stable')
+        self.datas_ordenadas = datas[self.ordem_datas]
+        self.dias = datas.astype('datetime64[D]')
+        # Máscara de dias úteis por calendário (UF), calculada na primeira vez que é pedida
+        self._dias_uteis = {}
+
+    def memory_usage(self, deep=True):
+        vetores = [*self.codigos.values(), self.ordem_datas, self.datas_ordenadas, self.dias, *self._dias_uteis.values()]
+        return sum(vetor.nbytes for vetor in vetores)
+
+    def valores_presentes(self, dimensao):
+        # Valores distintos na ordem em que aparecem (como Series.unique), incluindo o nulo
+        codigos = self.codigos[dimensao]
+        presentes = pd.unique(codigos)
+        categorias = self.valores[dimensao]
+        return [categorias[codigo] if codigo >= 0 else np.nan for codigo in presentes]
+
+    def dia_util(self, calendario):
+        if calendario.uf not in self._dias_uteis:
+            self._dias_uteis[calendario.uf] = calendario.eh_dia_util(self.dias)
+        return self._dias_uteis[calendario.uf]
+
+    def _mascara_dimensao(self, dimensao, selecionados):
+        categorias = self.valores[dimensao]
+        # Última posição da tabela = código -1 (nulo)
+        permitidos = np.zeros(len(categorias) + 1, dtype=bool)
+        selecionados = pd.Index(list(selecionados), dtype=object)
+        posicoes = categorias.get_indexer(selecionados.dropna())
+        permitidos[posicoes[posicoes >= 0]] = True
+        permitidos[-1] = selecionados.hasnans
+        return permitidos[self.codigos[dimensao]]
+
+    def mascara(self, selecao, inicio=None, fim=None, calendario=None):
+        # selecao: {dimensão: valores aceitos}; None (ou ausente) = sem restrição
+        # calendario: se informado, mantém só os dias úteis dele
+        if inicio is None and fim is None:
+            mascara = np.ones(self.tamanho, dtype=bool)
+        else:
+            mascara = np.zeros(self.tamanho, dtype=bool)
+            esquerda = 0 if inicio is None else np.searchsorted(self.datas_ordenadas, np.datetime64(inicio, 'ns'), 'left')
+            direita = self.tamanho if fim is None else np.searchsorted(self.datas_ordenadas, np.datetime64(fim, 'ns'), 'right')
+            mascara[self.ordem_datas[esquerda:direita]] = True
+        for dimensao, selecionados in selecao.items():
+            if selecionados is not None:
+                mascara &= self._mascara_dimensao(dimensao, selecionados)
+        if calendario is not None:
+            mascara &= self.dia_util(calendario)
+        return mascara
+
+    def posicoes(self, selecao, inicio=None, fim=None, calendario=None):
+        return np.flatnonzero(self.mascara(selecao, inicio, fim, calendario))
+
+
+DIMENSOES_HUBSPOT = ['equipe', 'produto', 'convenio_acronimo', 'etapa', 'origem', 'duplicado']
+DIMENSOES_GASTO = ['Convênio', 'Produto', 'Canal', 'Equipe']
+
+cache_indices = CacheLRU(max_entradas=8)
+
+
+def indice_hubspot(dataframe):
+    return memoizar_por_objetos(cache_indices, [dataframe], lambda: IndiceFiltros(dataframe, DIMENSOES_HUBSPOT))
+
+
+def indice_gasto(dataframe):
+    return memoizar_por_objetos(cache_indices, [dataframe], lambda: IndiceFiltros(dataframe, DIMENSOES_GASTO))
+
+
+def aplicar(dataframe, posicoes):
+    # Uma única cópia com as linhas selecionadas (take), em vez de um frame por filtro
+    return dataframe.take(posicoes)
@@ -0,0 +1,415 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+import config
+from cache import CacheLRU, hash_conteudo
+
+cache_graficos = CacheLRU(max_entradas=config.CACHE_GRAFICOS_MAX_ENTRADAS)
+
+
+def impressao_digital(*entradas):
+    # Hash do conteúdo das entradas de um gráfico (frames, arrays e parâmetros simples)
+    partes = []
+    for entrada in entradas:
+        if isinstance(entrada, pd.DataFrame):
+            partes.append(repr(list(entrada.columns)) + repr(list(entrada.dtypes)))
+            partes.append(pd.util.hash_pandas_object(entrada, index=True).to_numpy().tobytes())
+        elif isinstance(entrada, pd.Series):
+            partes.append(repr(entrada.name) + repr(entrada.dtype))
+            partes.append(pd.util.hash_pandas_object(entrada, index=True).to_numpy().tobytes())
+        elif isinstance(entrada, np.ndarray):
+            partes.append(str(entrada.dtype) + str(entrada.shape))
+            partes.append(np.ascontiguousarray(entrada).tobytes())
+        else:
+            partes.append(repr(entrada))
+    return hash_conteudo(*partes)
+
+
+def figura(nome, entradas, construir):
+    """Figura Plotly memoizada pela impressão digital das entradas (agregado + parâmetros de layout).
+
+    Gráfico com as mesmas entradas reaproveita o objeto já montado, sem refazer o px.*
+    nem os update_layout. A figura devolvida é compartilhada: não deve ser alterada.
+    """
+    return cache_graficos.obter_ou_calcular((nome, impressao_digital(*entradas)), construir)
+
+
+# Cores fixas por produto nos gráficos de geração de leads
+MAPA_CORES_PRODUTO = {
+    "Novo": "#1f77b4",               # azul claro
+    "Cartão": "#ff7f0e",             # laranja vibrante
+    "Benefício": "#2ca02c",          # verde claro
+    "Benefício e Cartão": "#d62728", # vermelho vibrante
+    "Port": "#9467bd"                # roxo claro
+}
+
+
+def grafico_gasto_convenio(convenios):
+    df_long = pd.melt(
+        convenios,
+        id_vars='conv_prod',
+        value_vars=['comissao_gerada', 'gasto_total'],
+        var_name='tipo',
+        value_name='valor'
+    )
+    fig = px.bar(
+        df_long,
+        x='valor',
+        y='conv_prod',
+        color='tipo',
+        barmode='group',
+        labels={'conv_prod': 'Convênio - Produto', 'valor': 'Valor (R$)', 'tipo': 'Tipo de Valor'},
+        text='valor'
+    )
+
+    fig.update_traces(
+        textposition='outside',
+        textfont=dict(size=20, color='white')
+    )
+
+    fig.update_layout(
+        height=1000,
+        width=1800,
+        xaxis_tickangle=-50,
+        bargap=0.4,
+        bargroupgap=0.2,
+        xaxis=dict(
+            tickfont=dict(size=18)
+        )
+    )
+    return fig
+
+
+def grafico_leads_convenio(grouped):
+    graf1 = px.bar(
+        grouped,
+        x='quantidade',
+        y='convenio_acronimo',
+        color='produto',
+        title='Leads Gerados por Convênio',
+        color_discrete_map=MAPA_CORES_PRODUTO
+    )
+    graf1.update_layout(
+        title='1. Leads Gerados por Convênio',
+        xaxis_title='Quantidade',
+        font=dict(size=16),
+        yaxis_title='Convênio',
+        legend_title='Produto',
+        xaxis_tickfont_size=12,
+        height=900,
+        width=800,
+        margin=dict(l=0, r=0, t=30, b=0)
+    )
+    return graf1
+
+
+def grafico_leads_dia(quantidade_dia_produto, quantidade_dia_total):
+    # Criando o gráfico de barras empilhadas
+    fig2 = px.bar(
+        quantidade_dia_produto,
+        x='data',
+        y='quantidade',
+        color='produto',
+        title='Leads Gerados por Dia por Produto',
+        barmode='stack',
+        text='quantidade',
+        color_discrete_map=MAPA_CORES_PRODUTO
+    )
+    # Adicionando a linha para a quantidade total de leads por dia
+    fig2.add_trace(go.Scatter(
+        x=quantidade_dia_total['data'],
+        y=quantidade_dia_total['quantidade_total'],
+        line=dict(color='#8B5CF6', width=3),
+        line_shape='spline',
+        mode='lines+markers',
+        name='Total de Leads',
+        marker=dict(size=6),
+        hovertemplate='<b>Data:</b> %{x}<br>'  # Exibe a data
+                    + '<b>Total de Leads:</b> %{y}<extra></extra>',  # Exibe a quantidade total
+    ))
+
+    # Atualizando o layout do gráfico
+    fig2.update_layout(
+        title='2. Leads Gerados por Dia por Produto',
+        xaxis_title='Data',
+        yaxis_title='Quantidade de Leads',
+        legend=dict(font=dict(size=10)),
+        xaxis_tickfont_size=12,
+        height=900,
+        width=800,
+        bargap=0.1,  # Reduz o espaço entre as barras
+        bargroupgap=0.2,  # Ajusta o espaçamento entre os grupos de barras
+        margin=dict(l=0, r=10, t=25, b=0),
+        showlegend=True
+    )
+    return fig2
+
+
+def grafico_perda_convenio(leads_perdidos, total_gerado_filtrado):
+    graf3 = px.bar(
+        leads_perdidos,
+        x='convenio_acronimo',
+        y='quantidade',
+        title='TOP 5 convênios com mais leads perdidos'
+    )
+
+    # Atualizar layout
+    graf3.update_layout(
+        title='3. TOP 5 convênios com mais leads perdidos',
+        xaxis_title='Convênio',
+        yaxis_title='Quantidade de Leads',
+        legend_orientation='h',
+        legend_y=1.1,
+        showlegend=False,
+        xaxis_tickfont_size=12,
+        height=550,
+        width=600,
+        margin=dict(l=0, r=10, t=40, b=0)
+    )
+
+    # Atualizar traces para incluir motivo_fechamento_agrupado no hover
+    graf3.update_traces(
+        hovertemplate="Convênio: %{x}<br>" +
+                    "Leads perdidos: %{y}<br>" +
+                    "Motivo: %{customdata[0]}<br>" +  # Exibir o motivo de fechamento
+                    "Total de leads gerados: " + str(total_gerado_filtrado) + "<br>" +
+                    "Porcentagem: %{customdata[1]:.1f}%<extra></extra>",
+        customdata=leads_perdidos[['motivo_fechamento_agrupado', 'porcentagem']].values  # Passar os dados adicionais
+    )
+    return graf3
+
+
+def grafico_perda_motivo(leads_perdidos, total_gerado_filtrado):
+    graf4 = px.bar(
+        leads_perdidos,
+        x="motivo_fechamento",
+        y="quantidade",
+        title="TOP 5 motivos de perda",
+        color="porcentagem",
+        text=leads_perdidos["porcentagem"].map(lambda x: f"{x:.1f}%")  # Exibir a porcentagem nas barras
+    )
+
+    graf4.update_traces(
+        hovertemplate="Motivo: %{y}<br>" +  # %{y} representa 'motivo_fechamento'
+        "Leads perdidos: %{x}<br>" +  # %{x} representa 'quantidade'
+        "Total de leads gerados: " + str(total_gerado_filtrado) + "<br>" +
+        "Porcentagem: %{customdata:.1f}%<extra></extra>",  # %{customdata} para exibir a porcentagem
+        customdata=leads_perdidos["porcentagem"]  # Passa a porcentagem para o hover
+    )
+
+    graf4.update_layout(
+        title='3. TOP 5 motivos de perda',
+        xaxis_title='',
+        yaxis_title='Quantidade',
+        legend_orientation='h',
+        legend_y=1.1,
+        xaxis_tickfont_size=12,
+        height=600,
+        width=750,
+        margin=dict(l=30, r=10, t=30, b=0)
+    )
+    return graf4
+
+
+def grafico_comissao(resumo, outliers):
+    # Caixas a partir dos quartis/cercas já calculados + amostra dos discrepantes
+    graf5 = go.Figure(go.Box(
+        x=resumo['grupo'].astype(str),
+        q1=resumo['q1'],
+        median=resumo['mediana'],
+        q3=resumo['q3'],
+        lowerfence=resumo['cerca_inferior'],
+        upperfence=resumo['cerca_superior'],
+        name='comissao_projetada',
+        boxpoints=False,
+        showlegend=False,
+        hovertext=resumo['n'].map(lambda n: f"n={n}"),
+    ))
+    graf5.add_trace(go.Scatter(
+        x=outliers['grupo'].astype(str),
+        y=outliers['valor'],
+        mode='markers',
+        name='discrepantes',
+        showlegend=False,
+        customdata=outliers['quantidade'],
+        hovertemplate="Convênio: %{x}<br>Comissão: %{y:.2f}<br>Leads: %{customdata}<extra></extra>",
+    ))
+
+    graf5.update_layout(
+            title='5. Comissão média por convenio dos leads gerados',
+            xaxis_title='',
+            yaxis_title='Quantidade',
+            legend_orientation='h',
+            legend_y=1.0,
+            xaxis_tickfont_size=12,
+            height=600,
+            width=1300,
+            margin=dict(l=30, r=10, t=40, b=0)
+        )
+    return graf5
+
+
+def grafico_funil(df_funil):
+    # Texto para mostrar dentro do gráfico
+    df_funil = df_funil.assign(texto=[
+        f"{quantidade}\n({pct:.1f}%)" for quantidade, pct in zip(df_funil['quantidade'], df_funil['pct_inicio'])
+    ])
+
+    # Criar o gráfico com plotly express
+    fig = px.funnel(
+        df_funil,
+        x='quantidade',
+        y='etapa',
+        text='texto',
+        labels={'etapa': 'Etapa do Funil', 'quantidade': 'Leads'},
+        color_discrete_sequence=["#00BFFF", "#1E90FF", "#6495ED", "#7B68EE", "#8A2BE2"]
+    )
+
+    # Atualiza layout e estilo
+    fig.update_traces(
+        textposition='auto',
+        textfont_size=26,  # ← funciona aqui com px
+        marker_line_width=1,
+        marker_line_color='white'
+    )
+
+    fig.update_layout(
+        title='5. Funil de Etapas do Hubspot',
+        xaxis_title='',
+        yaxis_title='Quantidade',
+        legend_orientation='h',
+        legend_y=1.0,
+        xaxis_tickfont_size=12,
+        height=800,
+        width=1300,
+        margin=dict(l=30, r=10, t=40, b=0)
+    )
+    return fig
+
+
+def grafico_cohort(taxas, tamanhos, evento_escolhido, agrupamento='D'):
+    # Formata label do eixo Y com total de leads
+    formato_cohort = '%Y-%m' if agrupamento == 'M' else '%Y-%m-%d'
+    rotulos = taxas.index.strftime(formato_cohort) + " (n=" + tamanhos.astype(str).to_numpy() + ")"
+
+    # Cohorts mais recentes em cima
+    heatmap_data = taxas.set_axis(rotulos).iloc[::-1]
+
+    # Gera o heatmap com Plotly
+    fig = px.imshow(
+        heatmap_data,
+        labels=dict(
+            x=f"Dias até {evento_escolhido.lower()}",
+            y="Data de entrada (cohort)",
+            color="Conversão (%)"
+        ),
+        color_continuous_scale="Cividis",
+        aspect="auto",
+        # Texto nas células só enquanto a matriz é pequena o bastante para ler
+        text_auto=".1f" if heatmap_data.size <= 5000 else False
+    )
+
+    fig.update_layout(
+        title=f"Cohort por {evento_escolhido}",
+        title_font_size=22,
+        height=600,
+        font=dict(size=22),
+        xaxis=dict(
+            title=f"Dias até {evento_escolhido.lower()}",
+            title_font=dict(size=16),
+            tickfont=dict(size=12)
+        ),
+        yaxis=dict(
+            title="Data de entrada (cohort)",
+            title_font=dict(size=16),
+            tickfont=dict(size=12)
+        ),
+        coloraxis_colorbar=dict(
+            title="Conversão (%)",
+            titlefont=dict(size=14),
+            tickfont=dict(size=12),
+            ticksuffix="%"
+        )
+    )
+    return fig
+
+
+def grafico_cac(convenios_cac):
+    # Gráfico de barras
+    fig = px.bar(
+        convenios_cac,
+        x='CAC',
+        y='conv_prod',
+        orientation='h',
+        text='CAC',
+        labels={'CAC': 'CAC (R$)', 'conv_prod': 'Convênio - Produto'}
+    )
+
+    fig.update_traces(
+        texttemplate='R$ %{text:.2f}',
+        textposition='outside'
+    )
+
+    fig.update_layout(
+        title="CAC por Convênio e Produto",
+        height=800,
+        xaxis_title="CAC (R$)",
+        yaxis_title="",
+        font=dict(size=14),
+        xaxis_tickprefix='R$ '
+    )
+    return fig
+
+
+def grafico_roi(convenios_roi):
+    # Gráfico de barras
+    fig = px.bar(
+        convenios_roi,
+        x='ROI (%)',
+        y='conv_prod',
+        orientation='h',
+        text='ROI (%)',
+        color='ROI (%)',
+        color_continuous_scale='Viridis',
+        labels={'ROI (%)': 'ROI (%)', 'conv_prod': 'Convênio - Produto'},
+    )
+
+    fig.update_traces(
+        texttemplate='%{text:.2f}%',
+        textposition='outside'
+    )
+
+    fig.update_layout(
+        title="ROI por Convênio e Produto",
+        height=800,
+        xaxis_title="ROI (%)",
+        yaxis_title="",
+        font=dict(size=14)
+    )
+    return fig
+
+
+def grafico_duplicados(por_origem):
+    # Leads duplicados por origem, com a % sobre os leads da origem
+    fig = px.bar(
+        por_origem,
+        x='origem',
+        y='duplicados',
+        text=por_origem['porcentagem'].map(lambda x: f"{x:.1f}%"),
+        labels={'origem': 'Origem', 'duplicados': 'Leads duplicados'},
+    )
+
+    fig.update_traces(
+        hovertemplate="Origem: %{x}<br>Duplicados: %{y}<br>Leads: %{customdata[0]}<extra></extra>",
+        customdata=por_origem[['leads']],
+    )
+
+    fig.update_layout(
+        title="Leads duplicados por origem",
+        xaxis_title="",
+        yaxis_title="Quantidade",
+        font=dict(size=14)
+    )
+    return fig
@@ -0,0 +1,252 @@
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+import config
+import instrumentacao
+from cache import CacheLRU, hash_conteudo, memoizar_por_objetos
+from tratamento import (
+    COLUNAS_NECESSARIAS,
+    DTYPES_HUBSPOT,
+    MAPA_COLUNAS,
+    VERSAO_TRATAMENTO,
+    alinhar_dimensoes,
+    concatenar_blocos,
+    modificado_em,
+    resolver_repetidos,
+    tratar_arquivo_hubspot,
+    tratar_arquivo_pagos,
+)
+
+CABECALHOS_NECESSARIOS = {origem for origem, destino in MAPA_COLUNAS.items() if destino in COLUNAS_NECESSARIAS}
+
+cache_ingestao = CacheLRU(
+    max_entradas=config.CACHE_INGESTAO_MAX_ENTRADAS,
+    max_bytes=config.CACHE_INGESTAO_MAX_MB * 1024 ** 2,
+)
+
+
+def ler_hubspot_em_blocos(origem, tamanho_bloco=None):
+    # Lê o CSV (caminho ou arquivo aberto) em blocos de tamanho fixo, só com as colunas
+    # usadas e dtypes explícitos; cada bloco é tratado e descartado antes do próximo,
+    # então o pico de memória é o bloco bruto + o resultado já compacto
+    leitor = pd.read_csv(
+        origem,
+        usecols=lambda coluna: coluna in CABECALHOS_NECESSARIOS,
+        dtype=DTYPES_HUBSPOT,
+        chunksize=tamanho_bloco or config.TAMANHO_BLOCO,
+    )
+    return concatenar_blocos(tratar_arquivo_hubspot(bloco) for bloco in leitor)
+
+
+def _origem_csv(conteudo):
+    # Bytes já na memória (envio pelo painel) ou caminho (os.PathLike), lido do disco
+    # pelo read_csv sem carregar o arquivo inteiro
+    if isinstance(conteudo, os.PathLike):
+        return conteudo, os.path.getsize(conteudo)
+    return io.BytesIO(conteudo), len(conteudo)
+
+
+def tratar_hubspot(conteudo):
+    origem, tamanho = _origem_csv(conteudo)
+    if tamanho > config.STREAMING_ACIMA_MB * 1024 ** 2:
+        with instrumentacao.etapa('leitura_tratamento_em_blocos'):
+            return ler_hubspot_em_blocos(origem)
+    with instrumentacao.etapa('leitura_hubspot'):
+        bruto = pd.read_csv(origem)
+    with instrumentacao.etapa('tratamento_hubspot'):
+        return tratar_arquivo_hubspot(bruto)
+
+
+def tratar_gasto(conteudo):
+    with instrumentacao.etapa('leitura_gasto'):
+        bruto = pd.read_csv(_origem_csv(conteudo)[0], sep=';')
+    with instrumentacao.etapa('tratamento_gasto'):
+        return tratar_arquivo_pagos(bruto)
+
+
+TRATADORES = {'hubspot': tratar_hubspot, 'gasto': tratar_gasto}
+
+
+def chave_arquivo(tabela, conteudo):
+    # Chave = hash do conteúdo do arquivo (bytes ou caminho) + versão do tratamento
+    return hash_conteudo(tabela, VERSAO_TRATAMENTO, conteudo)
+
+
+def chaves_arquivos(arquivos, chaves=None):
+    # chave_arquivo de cada [(nome, conteudo)] (None se não reconhecido); `chaves` já
+    # calculadas, na mesma ordem, poupam o hash do conteúdo
+    chaves = chaves or [None] * len(arquivos)
+    return [chave or (chave_arquivo(tabela_do_arquivo(nome), conteudo) if tabela_do_arquivo(nome) else None)
+            for (nome, conteudo), chave in zip(arquivos, chaves)]
+
+
+def chave_envio(arquivos, chaves=None):
+    # Chave do dataset de um envio [(nome, conteudo)]: os arquivos reconhecidos, na ordem
+    # (a ordem decide as linhas repetidas). None sem arquivo do HubSpot
+    chaves = [chave for chave in chaves_arquivos(arquivos, chaves) if chave]
+    if not any(tabela_do_arquivo(nome) == 'hubspot' for nome, _ in arquivos):
+        return None
+    return hash_conteudo('envio', *chaves)
+
+
+def carregar_hubspot(conteudo, chave=None):
+    # `chave`: a chave_arquivo já calculada (poupa o hash do conteúdo)
+    chave = chave or chave_arquivo('hubspot', conteudo)
+    return cache_ingestao.obter_ou_calcular(chave, lambda: tratar_hubspot(conteudo))
+
+
+def carregar_gasto(conteudo, chave=None):
+    chave = chave or chave_arquivo('gasto', conteudo)
+    return cache_ingestao.obter_ou_calcular(chave, lambda: tratar_gasto(conteudo))
+
+
+def tabela_do_arquivo(nome):
+    # Pelo nome do arquivo enviado: "hubspot" ou "gasto" (None = ignorado)
+    nome = nome.lower()
+    if 'hubspot' in nome:
+        return 'hubspot'
+    if 'gasto' in nome:
+        return 'gasto'
+    return None
+
+
+_pool = None
+_lock_pool = threading.Lock()
+
+
+def _iniciar_processo():
+    # Os processos do pool não gravam no log de instrumentação: o tempo de cada arquivo
+    # volta para o processo principal junto com o resultado
+    config.INSTRUMENTACAO = False
+
+
+def _tratar_em_processo(tabela, conteudo):
+    inicio = time.perf_counter()
+    dataframe = TRATADORES[tabela](conteudo)
+    return dataframe, time.perf_counter() - inicio
+
+
+def _pool_ingestao():
+    # Um pool por processo, criado no primeiro uso e reaproveitado entre reruns; "spawn"
+    # porque o servidor do Streamlit tem várias threads (fork copiaria locks travados)
+    global _pool
+    with _lock_pool:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=config.PROCESSOS_INGESTAO,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_iniciar_processo,
+            )
+        return _pool
+
+
+def _descartar_pool():
+    global _pool
+    with _lock_pool:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def preparar_arquivos(arquivos, chaves=None):
+    """Lê e trata os arquivos [(nome, conteudo)] que ainda não estão no cache de ingestão.
+
+    Com mais de um arquivo novo, cada um vai para um processo do pool (leitura e tratamento
+    em paralelo, um núcleo por arquivo); os resultados entram no cache de ingestão. Devolve
+    os frames tratados e uma linha por arquivo: nome, tabela, linhas, segundos e origem
+    (cache, processo ou local), na ordem recebida. `chaves`: as chave_arquivo já calculadas.
+    """
+    chaves_recebidas = chaves_arquivos(arquivos, chaves)
+    chaves, relatorio, pendentes, tratados = [], [], {}, {}
+    for (nome, conteudo), chave in zip(arquivos, chaves_recebidas):
+        tabela = tabela_do_arquivo(nome)
+        if tabela is None:
+            continue
+        linha = {'arquivo': nome, 'tabela': tabela, 'linhas': None, 'segundos': 0.0, 'origem': 'cache'}
+        chaves.append(chave)
+        relatorio.append(linha)
+        if chave in cache_ingestao:
+            tratados[chave] = cache_ingestao.obter(chave)
+            linha['linhas'] = len(tratados[chave])
+        elif chave in pendentes:
+            # Mesmo conteúdo enviado duas vezes: trata uma vez só
+            pendentes[chave][2].append(linha)
+        else:
+            pendentes[chave] = (tabela, conteudo, [linha])
+
+    resultados = {}
+    if len(pendentes) > 1 and config.PROCESSOS_INGESTAO > 1:
+        try:
+            pool = _pool_ingestao()
+            futuros = {chave: pool.submit(_tratar_em_processo, tabela, conteudo)
+                       for chave, (tabela, conteudo, _) in pendentes.items()}
+            for chave, futuro in futuros.items():
+                resultados[chave] = futuro.result() + ('processo',)
+        except BrokenProcessPool:
+            # Processo morto (ex.: falta de memória): o que faltou é tratado aqui mesmo
+            _descartar_pool()
+
+    for chave, (tabela, conteudo, linhas) in pendentes.items():
+        if chave not in resultados:
+            inicio = time.perf_counter()
+            dataframe = TRATADORES[tabela](conteudo)
+            resultados[chave] = (dataframe, time.perf_counter() - inicio, 'local')
+        dataframe, segundos, origem = resultados[chave]
+        cache_ingestao.guardar(chave, dataframe)
+        tratados[chave] = dataframe
+        for linha in linhas:
+            linha.update(linhas=len(dataframe), segundos=round(segundos, 3), origem=origem)
+    # Os frames saem daqui e não do cache, que pode ter descartado os primeiros de um lote grande
+    return [tratados[chave] for chave in chaves], relatorio
+
+
+cache_juncao = CacheLRU(max_entradas=4)
+
+
+def juntar(tabela, frames):
+    # Os arquivos da mesma tabela num frame só (com um arquivo não há concat), com as linhas
+    # repetidas resolvidas como na base local (HubSpot por id, também dentro de um arquivo;
+    # gasto por CHAVE_GASTO) e o gasto em ordem de data.
+    # Memoizado pela identidade dos frames do cache, para os caches por dataset valerem
+    def calcular():
+        marcados = []
+        for sequencia, frame in enumerate(frames):
+            marcado = frame.assign(_sequencia=sequencia)
+            if tabela == 'hubspot':
+                marcado['_modificado_em'] = modificado_em(marcado)
+            marcados.append(marcado)
+        dataframe = resolver_repetidos(tabela, concatenar_blocos(marcados))
+        if tabela == 'gasto':
+            dataframe = dataframe.sort_values('data', kind='stable')
+        return dataframe.drop(columns=['_sequencia', '_modificado_em'], errors='ignore').reset_index(drop=True)
+
+    return memoizar_por_objetos(cache_juncao, frames, calcular)
+
+
+def carregar_arquivos(arquivos, chaves=None):
+    # [(nome, conteudo)] -> (df_hubspot, df_gasto, relatório por arquivo); tabela sem
+    # arquivo fica None
+    dataframes, relatorio = preparar_arquivos(arquivos, chaves)
+    frames = {'hubspot': [], 'gasto': []}
+    for dataframe, linha in zip(dataframes, relatorio):
+        frames[linha['tabela']].append(dataframe)
+    df_hubspot, df_gasto = (juntar(tabela, frames[tabela]) if frames[tabela] else None for tabela in ['hubspot', 'gasto'])
+    return df_hubspot, df_gasto, relatorio
+
+
+cache_alinhamento = CacheLRU(max_entradas=4)
+
+
+def alinhar(df_hubspot, df_gasto):
+    # Memoizado pela identidade dos frames: o mesmo par carregado devolve sempre os
+    # mesmos frames alinhados, e os índices/caches por dataset continuam valendo
+    return memoizar_por_objetos(
+        cache_alinhamento, [df_hubspot, df_gasto], lambda: alinhar_dimensoes(df_hubspot, df_gasto)
+    )
@@ -0,0 +1,174 @@
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+
+import config
+
+# Execução ativa por thread (o Streamlit roda o script de cada sessão na sua thread)
+_local = threading.local()
+_lock_arquivo = threading.Lock()
+
+# Últimas execuções do processo (todas as sessões), para o painel de depuração
+historico = deque(maxlen=50)
+
+
+class Execucao:
+    """Tempo e pico de memória das etapas de um rerun (ou de um fragmento rodando sozinho).
+
+    As etapas podem ser aninhadas (ex.: leitura dentro de ingestão); o pico de cada uma é
+    o máximo de memória alocada acima do que havia no início dela, medido pelo tracemalloc.
+    O tracemalloc é global ao processo: com várias sessões ao mesmo tempo, os picos
+    incluem alocações das outras.
+    """
+
+    def __init__(self, tipo='rerun', perfil=False):
+        self.tipo = tipo
+        self.etapas = []
+        self.contexto = {}
+        self._pilha = []
+        self._pico_total = 0
+        self.memoria = config.INSTRUMENTACAO_MEMORIA
+        if self.memoria and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.perfil = cProfile.Profile() if perfil else None
+        self.momento = datetime.now()
+        self._inicio = time.perf_counter()
+        self._memoria_inicio = self._registrar_pico()
+        if self.perfil:
+            self.perfil.enable()
+
+    def _registrar_pico(self):
+        # Passa o pico desde a última leitura para todas as etapas abertas e zera o pico;
+        # devolve a memória alocada agora
+        if not self.memoria:
+            return 0
+        atual, pico = tracemalloc.get_traced_memory()
+        for item in self._pilha:
+            item['pico'] = max(item['pico'], pico)
+        self._pico_total = max(self._pico_total, pico)
+        tracemalloc.reset_peak()
+        return atual
+
+    @contextmanager
+    def etapa(self, nome):
+        registro = {'etapa': nome, 'nivel': len(self._pilha)}
+        self.etapas.append(registro)
+        item = {'pico': 0, 'memoria_inicio': self._registrar_pico()}
+        self._pilha.append(item)
+        inicio = time.perf_counter()
+        try:
+            yield registro
+        finally:
+            registro['segundos'] = round(time.perf_counter() - inicio, 6)
+            self._registrar_pico()
+            self._pilha.pop()
+            if self.memoria:
+                registro['pico_mb'] = round(max(item['pico'] - item['memoria_inicio'], 0) / 1024 ** 2, 2)
+
+    def finalizar(self):
+        resultado = {
+            'momento': self.momento.isoformat(timespec='milliseconds'),
+            'tipo': self.tipo,
+            'pid': os.getpid(),
+            'thread': threading.current_thread().name,
+            'segundos': round(time.perf_counter() - self._inicio, 6),
+            **self.contexto,
+            'etapas': self.etapas,
+        }
+        if self.memoria:
+            self._registrar_pico()
+            resultado['pico_mb'] = round(max(self._pico_total - self._memoria_inicio, 0) / 1024 ** 2, 2)
+        if self.perfil:
+            self.perfil.disable()
+            resultado['perfil'], resultado['perfil_resumo'] = self._salvar_perfil()
+        return resultado
+
+    def _salvar_perfil(self):
+        # Arquivo .prof completo (snakeviz, pstats) + as funções mais caras em texto
+        pasta = Path(config.DIR_PERFIS)
+        pasta.mkdir(parents=True, exist_ok=True)
+        caminho = pasta / f"{self.momento:%Y%m%d-%H%M%S-%f}-{self.tipo}.prof"
+        self.perfil.dump_stats(caminho)
+        texto = io.StringIO()
+        pstats.Stats(self.perfil, stream=texto).sort_stats('cumulative').print_stats(25)
+        return str(caminho), texto.getvalue()
+
+
+def _gravar(resultado):
+    linha = {chave: valor for chave, valor in resultado.items() if chave != 'perfil_resumo'}
+    with _lock_arquivo:
+        with open(config.ARQUIVO_INSTRUMENTACAO, 'a', encoding='utf-8') as arquivo:
+            arquivo.write(json.dumps(linha, ensure_ascii=False, default=str) + '\n')
+    historico.append(linha)
+
+
+def iniciar(perfil=None):
+    # Começa a medir o rerun desta thread (nada acontece com a instrumentação desligada)
+    if not config.INSTRUMENTACAO:
+        return None
+    _local.execucao = Execucao('rerun', config.PERFIL_CPROFILE if perfil is None else perfil)
+    return _local.execucao
+
+
+def atual():
+    return getattr(_local, 'execucao', None)
+
+
+def anotar(**valores):
+    # Contexto extra gravado junto do rerun (ex.: número de linhas do dataset)
+    execucao = atual()
+    if execucao:
+        execucao.contexto.update(valores)
+
+
+def etapa(nome):
+    """Mede o bloco como uma etapa do rerun ativo. Sem rerun ativo (fragmento rodando
+    sozinho) a etapa vira uma execução própria, gravada ao terminar."""
+    if not config.INSTRUMENTACAO:
+        return nullcontext()
+    if atual() is None:
+        return _execucao_avulsa(nome)
+    return atual().etapa(nome)
+
+
+def medida(nome):
+    # Decorador: cada chamada da função é medida como a etapa `nome`
+    def decorar(funcao):
+        @functools.wraps(funcao)
+        def medir(*args, **kwargs):
+            with etapa(nome):
+                return funcao(*args, **kwargs)
+        return medir
+    return decorar
+
+
+@contextmanager
+def _execucao_avulsa(nome):
+    _local.execucao = execucao = Execucao('fragmento')
+    try:
+        with execucao.etapa(nome) as registro:
+            yield registro
+    finally:
+        _local.execucao = None
+        _gravar(execucao.finalizar())
+
+
+def finalizar():
+    # Fecha o rerun desta thread, grava a linha no log e devolve o registro
+    execucao = atual()
+    if execucao is None:
+        return None
+    _local.execucao = None
+    resultado = execucao.finalizar()
+    _gravar(resultado)
+    return resultado
@@ -0,0 +1,300 @@
+from functools import cached_property
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import config
+import filtros
+from acumulados import periodo_anterior
+from agregacoes import CamadaAgregacoes, CamadaAgregacoesMotor
+from calendario import calendario
+from cohort import dias_dataset
+from cubo import cubo_gasto, cubo_hubspot
+from distintos import ERRO_PADRAO, estimar
+from duplicados import marcar_duplicados
+from ingestao import alinhar, carregar_gasto, carregar_hubspot
+
+# Dimensão do HubSpot -> coluna equivalente no gasto (etapa não existe no gasto)
+DIMENSOES_GASTO_POR_HUBSPOT = {
+    'convenio_acronimo': 'Convênio',
+    'produto': 'Produto',
+    'origem': 'Canal',
+    'equipe': 'Equipe',
+}
+
+# Eventos do cohort: rótulo -> coluna de data
+EVENTOS_COHORT = {
+    'Pagamento': 'data_pago',
+    'Perda': 'data_perda',
+    'Negociação': 'data_negociacao',
+    'Contratação': 'data_contratacao',
+}
+
+
+def _rotulo_conv_prod(dataframe):
+    return dataframe['convenio_acronimo'].astype(str) + ' - ' + dataframe['produto'].astype(str)
+
+
+class MotorMetricas:
+    """Motor das métricas do painel, sem Streamlit.
+
+    Guarda o dataset alinhado e as estruturas montadas uma vez (índice de filtros e
+    cubos); `consulta` devolve, para um filtro, os KPIs e os agregados de cada painel
+    como dados. O dashboard (hubspot.py) e o relatório em lote (relatorio.py) usam isto.
+    """
+
+    def __init__(self, df_hubspot, df_gasto):
+        # Mesmo dicionário de categorias nos dois arquivos (filtros e merges por código)
+        self.df, self.df_gasto = alinhar(df_hubspot, df_gasto)
+        # Leads repetidos (mesmo CPF ou telefone dentro da janela), no dataset inteiro
+        self.df = marcar_duplicados(self.df)
+        self.indice = filtros.indice_hubspot(self.df)
+        self.cubo = cubo_hubspot(self.df)
+        self.cubo_gasto = cubo_gasto(self.df_gasto)
+
+    @classmethod
+    def de_arquivos(cls, caminho_hubspot, caminho_gasto):
+        # Lidos direto do disco: o HubSpot grande vai em blocos, sem os bytes na memória
+        return cls(carregar_hubspot(Path(caminho_hubspot)), carregar_gasto(Path(caminho_gasto)))
+
+    def valores_presentes(self, dimensao):
+        return self.indice.valores_presentes(dimensao)
+
+    def linhas(self):
+        return {'linhas_hubspot': len(self.df), 'linhas_gasto': len(self.df_gasto)}
+
+    def memory_usage(self, deep=True):
+        # Bytes do dataset alinhado, do índice e dos cubos (usado por tamanho_objeto)
+        frames = [self.df, self.df_gasto]
+        return sum(int(frame.memory_usage(deep=deep).sum()) for frame in frames) + sum(
+            estrutura.memory_usage(deep=deep) for estrutura in [self.indice, self.cubo, self.cubo_gasto])
+
+    def periodo_disponivel(self):
+        return self.df['data'].min(), self.df['data'].max()
+
+    def consulta(self, equipe=None, produto=None, convenio_acronimo=None, etapa=None, origem=None,
+                 inicio=None, fim=None, apenas_dias_uteis=True, uf_feriados=None, excluir_duplicados=False):
+        # Lista vazia ou None = sem restrição na dimensão; datas ausentes = período todo
+        return ConsultaMetricas.de_filtro(self, equipe, produto, convenio_acronimo, etapa, origem,
+                                          inicio, fim, apenas_dias_uteis, uf_feriados, excluir_duplicados)
+
+
+class ConsultaMetricas:
+    """Métricas de um estado de filtro. Os agregados vêm da CamadaAgregacoes (memoizada);
+    os frames devolvidos são novos e podem ser alterados por quem chama."""
+
+    def __init__(self, motor, selecao_hubspot, inicio, fim, calendario_uteis, apenas_dias_uteis):
+        self.motor = motor
+        self.selecao_hubspot = selecao_hubspot
+        self.inicio, self.fim = inicio, fim
+        self.calendario = calendario_uteis
+        self.apenas_dias_uteis = apenas_dias_uteis
+        self.calendario_filtro = calendario_uteis if apenas_dias_uteis else None
+        # O gasto é sempre filtrado pelos valores do HubSpot (sem seleção = todos os do HubSpot)
+        self.selecao_gasto = {
+            coluna_gasto: selecao_hubspot[dimensao] or motor.valores_presentes(dimensao)
+            for dimensao, coluna_gasto in DIMENSOES_GASTO_POR_HUBSPOT.items()
+        }
+        self.agregacoes = self._camada_agregacoes()
+
+    @classmethod
+    def de_filtro(cls, motor, equipe=None, produto=None, convenio_acronimo=None, etapa=None, origem=None,
+                  inicio=None, fim=None, apenas_dias_uteis=True, uf_feriados=None, excluir_duplicados=False):
+        selecao = {
+            'equipe': equipe or None,
+            'produto': produto or None,
+            'convenio_acronimo': convenio_acronimo or None,
+            'etapa': etapa or None,
+            'origem': origem or None,
+            # Só os não duplicados, em todos os KPIs e painéis
+            'duplicado': [False] if excluir_duplicados else None,
+        }
+        data_min, data_max = motor.periodo_disponivel()
+        inicio = pd.Timestamp(inicio) if inicio is not None else data_min
+        fim = pd.Timestamp(fim) if fim is not None else data_max
+        # Calendário com a tabela cobrindo os anos dos dados (feriados certos nos três motores)
+        return cls(motor, selecao, inicio, fim, calendario(uf_feriados or None, data_min, data_max),
+                   apenas_dias_uteis)
+
+    def _camada_agregacoes(self):
+        return CamadaAgregacoes(self.motor.cubo, self.motor.cubo_gasto, self.selecao_hubspot, self.selecao_gasto,
+                                self.inicio, self.fim, self.calendario_filtro)
+
+    @cached_property
+    def posicoes(self):
+        # Linhas do HubSpot no estado de filtro (só o cohort lê linhas; o resto sai dos cubos)
+        return self.motor.indice.posicoes(self.selecao_hubspot, self.inicio, self.fim, self.calendario_filtro)
+
+    def celulas(self):
+        return self.agregacoes.celulas()
+
+    def contar_dias(self, inicio, fim):
+        if self.apenas_dias_uteis:
+            # Contagem de dias úteis (com feriados) pela tabela do calendário
+            return self.calendario.dias_uteis_entre(inicio, fim)
+        return max((fim - inicio).days + 1, 0)
+
+    def kpis(self):
+        # Período escolhido e o anterior de mesmo tamanho, pelas somas acumuladas por dia
+        indice_diario = self.agregacoes.indice_diario()
+        inicio_anterior, fim_anterior = periodo_anterior(self.inicio, self.fim)
+        resultado = {'inicio': self.inicio, 'fim': self.fim,
+                     'inicio_anterior': inicio_anterior, 'fim_anterior': fim_anterior}
+        for sufixo, (inicio, fim) in {'': (self.inicio, self.fim), '_anterior': (inicio_anterior, fim_anterior)}.items():
+            totais = indice_diario.totais(inicio, fim)
+            leads = int(round(totais['leads']))
+            dias = self.contar_dias(inicio, fim)
+            comissao = totais['comissao']
+            gasto = round(totais['gasto'], 2)
+            resultado.update({
+                'leads' + sufixo: leads,
+                'dias' + sufixo: dias,
+                'media_leads_dia' + sufixo: round(leads / dias, 2) if dias > 0 else 0.0,
+                'pagos' + sufixo: int(round(totais['pagos'])),
+                'taxa_conversao' + sufixo: round(totais['pagos'] / leads * 100, 2) if leads else 0.0,
+                'comissao_gerada' + sufixo: comissao,
+                'gasto' + sufixo: gasto,
+                'lucro' + sufixo: round(comissao - gasto, 2),
+            })
+        return resultado
+
+    def clientes_unicos(self):
+        # Clientes distintos (CPF) e conversão por cliente no período e no anterior, pelos
+        # esboços HyperLogLog: estimativas com erro padrão relativo de ERRO_PADRAO
+        inicio_anterior, fim_anterior = periodo_anterior(self.inicio, self.fim)
+        resultado = {'erro_padrao': ERRO_PADRAO}
+        for sufixo, (inicio, fim) in {'': (self.inicio, self.fim), '_anterior': (inicio_anterior, fim_anterior)}.items():
+            todos, pagos = self.agregacoes.esbocos_clientes(inicio, fim)
+            clientes = int(round(estimar(todos)))
+            # Os pagos são parte dos clientes: a estimativa não passa do total
+            clientes_pagos = min(int(round(estimar(pagos))), clientes)
+            resultado.update({
+                'clientes' + sufixo: clientes,
+                'clientes_pagos' + sufixo: clientes_pagos,
+                'taxa_conversao_clientes' + sufixo: round(clientes_pagos / clientes * 100, 2) if clientes else 0.0,
+            })
+        return resultado
+
+    def gasto_x_comissao(self, top_n=10):
+        convenios = self.agregacoes.gasto_x_comissao().sort_values(by='comissao_gerada', ascending=False).head(top_n)
+        return convenios.assign(conv_prod=_rotulo_conv_prod(convenios))
+
+    def leads_por_convenio(self):
+        quantidade = self.agregacoes.somas(['convenio_acronimo'], ['leads']).rename(columns={'leads': 'quantidade_total'})
+        por_produto = self.agregacoes.somas(['convenio_acronimo', 'produto'], ['leads']).rename(columns={'leads': 'quantidade'})
+        return pd.merge(quantidade, por_produto, on='convenio_acronimo', how='left').sort_values(by='quantidade_total', ascending=False)
+
+    def leads_por_dia(self):
+        # (por dia e produto, total por dia); as células já respeitam o filtro de dias úteis
+        por_produto = self.agregacoes.somas(['data', 'produto'], ['leads']).rename(columns={'leads': 'quantidade'})
+        total = self.agregacoes.somas(['data'], ['leads']).rename(columns={'leads': 'quantidade_total'})
+        return por_produto, total
+
+    def _perdas(self, chaves):
+        # Leads perdidos (com id) por `chaves`
+        somas = self.agregacoes.somas(['etapa'] + chaves, ['ids'])
+        perdas = somas[somas['etapa'] == 'PERDA'].drop(columns='etapa').reset_index(drop=True)
+        return perdas.rename(columns={'ids': 'quantidade'})
+
+    def perdas_por_convenio(self):
+        total = self.kpis()['leads'] or 1
+        perdas = self._perdas(['convenio_acronimo', 'motivo_fechamento_agrupado']).sort_values(by='quantidade', ascending=False)
+        return perdas.assign(quantidade_gerada=total, porcentagem=perdas['quantidade'] / total * 100)
+
+    def perdas_por_motivo(self, top_n=5):
+        total = self.kpis()['leads'] or 1
+        perdas = self._perdas(['motivo_fechamento']).sort_values(by='quantidade', ascending=False).head(top_n)
+        return perdas.assign(porcentagem=perdas['quantidade'] / total * 100)
+
+    def leads_duplicados(self):
+        # Leads por origem: total, duplicados (duplicados.py) e % duplicados. Conta todos os
+        # leads do filtro, mesmo com os duplicados excluídos dos outros painéis
+        todos = type(self)(self.motor, {**self.selecao_hubspot, 'duplicado': None}, self.inicio, self.fim,
+                           self.calendario, self.apenas_dias_uteis)
+        somas = todos.agregacoes.somas(['origem', 'duplicado'], ['leads'])
+        somas = somas.assign(duplicados=somas['leads'].where(somas['duplicado'], 0))
+        por_origem = somas.groupby('origem', observed=True)[['leads', 'duplicados']].sum().reset_index()
+        por_origem = por_origem.sort_values(by='duplicados', ascending=False, kind='stable')
+        return por_origem.assign(porcentagem=por_origem['duplicados'] / por_origem['leads'] * 100)
+
+    def comissao_por_convenio(self):
+        # (resumo do boxplot por convênio, amostra de pontos discrepantes)
+        resumo, outliers = self.agregacoes.resumo_comissao_por_convenio()
+        return resumo.copy(), outliers.copy()
+
+    def funil(self):
+        medidas = ['n_lead', 'n_negociacao', 'n_contratacao', 'n_pago', 'n_perda']
+        totais = self.agregacoes.somas([], medidas).iloc[0]
+        funil = pd.DataFrame({
+            'etapa': ['LEAD', 'NEGOCIAÇÃO', 'CONTRATAÇÃO', 'PAGO', 'PERDA'],
+            'quantidade': [totais[medida] for medida in medidas],
+        })
+        # % em relação ao início do funil
+        total_inicio = funil.loc[0, 'quantidade'] if funil.loc[0, 'quantidade'] > 0 else 1
+        funil['pct_inicio'] = funil['quantidade'] / total_inicio * 100
+        return funil
+
+    def cohort(self, coluna_evento='data_pago', horizonte=None, agrupamento='D', acumulada=False):
+        # (taxas em % por cohort × dias até o evento, tamanho de cada cohort); dias cortados
+        # no último com algum evento
+        horizonte = config.COHORT_HORIZONTE_DIAS if horizonte is None else int(horizonte)
+        matriz = self._matriz_cohort(coluna_evento, horizonte, agrupamento)
+        dias_com_evento = np.flatnonzero(matriz.eventos.sum(axis=0))
+        largura = dias_com_evento[-1] + 1 if len(dias_com_evento) else 1
+        indice = matriz.cohorts.rename('cohort')
+        taxas = pd.DataFrame(matriz.taxas(acumulada)[:, :largura], index=indice, columns=np.arange(largura))
+        return taxas, pd.Series(matriz.tamanhos, index=indice, name='tamanho')
+
+    def _matriz_cohort(self, coluna_evento, horizonte, agrupamento):
+        return self.agregacoes.cohort(dias_dataset(self.motor.df), self.posicoes, coluna_evento, horizonte, agrupamento)
+
+    def cac(self, top_n=10):
+        convenios = self.agregacoes.gasto_x_leads()
+        # Evita divisão por zero
+        convenios = convenios[convenios['clientes'] > 0]
+        convenios = convenios.assign(CAC=convenios['gasto_total'] / convenios['clientes'])
+        convenios = convenios.sort_values(by='clientes', ascending=False).head(top_n)
+        return convenios.assign(conv_prod=_rotulo_conv_prod(convenios))
+
+    def roi(self, top_n=10):
+        convenios = self.agregacoes.gasto_x_comissao()
+        # Com gasto > 0, para evitar divisão por zero
+        convenios = convenios[convenios['gasto_total'] > 0]
+        roi = (convenios['comissao_gerada'] - convenios['gasto_total']) / convenios['gasto_total'] * 100
+        convenios = convenios.assign(**{'ROI (%)': roi}).sort_values(by='ROI (%)', ascending=False).head(top_n)
+        return convenios.assign(conv_prod=_rotulo_conv_prod(convenios))
+
+    def relatorio(self, top_n=10, coluna_evento='data_pago', horizonte=None, agrupamento='D'):
+        # Tudo o que o painel mostra, como {nome: dict ou DataFrame}
+        leads_dia_produto, leads_dia_total = self.leads_por_dia()
+        comissao_resumo, comissao_outliers = self.comissao_por_convenio()
+        cohort_taxas, cohort_tamanhos = self.cohort(coluna_evento, horizonte, agrupamento, acumulada=True)
+        return {
+            'kpis': {**self.kpis(), **self.clientes_unicos()},
+            'gasto_x_comissao': self.gasto_x_comissao(top_n),
+            'leads_por_convenio': self.leads_por_convenio(),
+            'leads_por_dia_produto': leads_dia_produto,
+            'leads_por_dia': leads_dia_total,
+            'perdas_por_convenio': self.perdas_por_convenio(),
+            'perdas_por_motivo': self.perdas_por_motivo(),
+            'leads_duplicados': self.leads_duplicados(),
+            'comissao_por_convenio': comissao_resumo,
+            'comissao_outliers': comissao_outliers,
+            'funil': self.funil(),
+            'cohort_conversao_acumulada': cohort_taxas.assign(tamanho=cohort_tamanhos),
+            'cac': self.cac(top_n),
+            'roi': self.roi(top_n),
+        }
+
+
+class ConsultaMotor(ConsultaMetricas):
+    """ConsultaMetricas dos motores que agregam as linhas por conta própria (MotorDuckDB,
+    MotorPolars): mesmos métodos e mesmos frames de saída."""
+
+    def _camada_agregacoes(self):
+        return CamadaAgregacoesMotor(self.motor, self.selecao_hubspot, self.selecao_gasto,
+                                     self.inicio, self.fim, self.calendario_filtro)
+
+    def _matriz_cohort(self, coluna_evento, horizonte, agrupamento):
+        return self.agregacoes.cohort(coluna_evento, horizonte, agrupamento)
@@ -0,0 +1,264 @@
+import shutil
+import tempfile
+import threading
+import weakref
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+import config
+from cubo import CHAVES_CUBO, CHAVES_CUBO_GASTO, COLUNAS_GASTO, COLUNAS_HUBSPOT, MEDIDAS_FUNIL
+from duplicados import CHAVES_CLIENTE, janela_ns
+from metricas import ConsultaMotor
+from quantis import CHAVE_ZERO, LOG_GAMA, MAIOR_VALOR, MENOR_BUCKET, MENOR_VALOR
+from tratamento import CHAVE_GASTO
+
+try:
+    import duckdb
+except ImportError:  # opcional: só o backend HUBSPOT_BACKEND=duckdb precisa
+    duckdb = None
+
+# Medidas do cubo (cubo.montar_cubo) em SQL
+MEDIDAS_SQL = {
+    'leads': 'count(*)',
+    'ids': 'count(id)',
+    'comissao_gerada': 'coalesce(sum(comissao_gerada), 0)',
+    'comissao_projetada': 'coalesce(sum(comissao_projetada), 0)',
+    **{medida: f'count({coluna})' for coluna, medida in MEDIDAS_FUNIL.items()},
+}
+
+# Início do cohort por agrupamento (semana começa na segunda, como em cohort.py)
+INICIO_COHORT_SQL = {
+    'D': 'CAST(data AS DATE)',
+    'W': "CAST(date_trunc('week', data) AS DATE)",
+    'M': "CAST(date_trunc('month', data) AS DATE)",
+}
+
+
+def _coluna(nome):
+    return '"' + nome.replace('"', '""') + '"'
+
+
+def _lista(colunas):
+    return ', '.join(_coluna(coluna) for coluna in colunas)
+
+
+def _chave_quantil_sql(coluna):
+    # Mesma chave de bucket de quantis.chaves, calculada no banco (NULL = valor ausente)
+    absoluto = f'least(greatest(abs({coluna}), {float(MENOR_VALOR)!r}), {float(MAIOR_VALOR)!r})'
+    bucket = f'CAST(ceil(ln({absoluto}) / {float(LOG_GAMA)!r}) AS BIGINT) + {1 - MENOR_BUCKET}'
+    return (f'CASE WHEN {coluna} IS NULL OR isnan({coluna}) THEN NULL '
+            f'WHEN {coluna} = 0 THEN {CHAVE_ZERO} '
+            f'WHEN {coluna} > 0 THEN {CHAVE_ZERO} + ({bucket}) '
+            f'ELSE {CHAVE_ZERO} - ({bucket}) END')
+
+
+def condicoes(selecao, inicio=None, fim=None, calendario=None):
+    """Filtro da barra lateral como cláusula WHERE + parâmetros, com a mesma semântica de
+    IndiceFiltros.mascara: seleção None não restringe, nulo selecionado vira IS NULL e o
+    calendário deixa só os dias úteis (segunda a sexta, menos os feriados dele)."""
+    partes, parametros = [], []
+    if inicio is not None:
+        partes.append('data >= ?')
+        parametros.append(pd.Timestamp(inicio).to_pydatetime())
+    if fim is not None:
+        partes.append('data <= ?')
+        parametros.append(pd.Timestamp(fim).to_pydatetime())
+    for dimensao, selecionados in selecao.items():
+        if selecionados is None:
+            continue
+        # Dimensões em texto; duplicado é booleano
+        valores = [valor if isinstance(valor, bool) else str(valor) for valor in selecionados if not pd.isna(valor)]
+        opcoes = []
+        if valores:
+            opcoes.append(f"{_coluna(dimensao)} IN ({', '.join('?' * len(valores))})")
+            parametros += valores
+        if len(valores) < len(selecionados):
+            opcoes.append(f'{_coluna(dimensao)} IS NULL')
+        partes.append('(' + ' OR '.join(opcoes) + ')' if opcoes else 'FALSE')
+    if calendario is not None:
+        partes.append('isodow(CAST(data AS DATE)) <= 5 AND NOT list_contains(?::DATE[], CAST(data AS DATE))')
+        parametros.append(calendario.feriados.tolist())
+    return ' AND '.join(partes) or 'TRUE', parametros
+
+
+def _fechar(conexao, pasta):
+    conexao.close()
+    shutil.rmtree(pasta, ignore_errors=True)
+
+
+class MotorDuckDB:
+    """Motor das métricas com o histórico num banco DuckDB em disco, para datasets maiores
+    que a memória (HUBSPOT_BACKEND=duckdb).
+
+    Na criação, as partes Parquet da base local são copiadas para um banco temporário,
+    com as linhas repetidas resolvidas como em resolver_repetidos; daí em diante filtros,
+    cubos, totais por dia, esboços de quantis e cohorts são consultas SQL, e só os
+    resultados (agregados) chegam ao pandas. A interface é a do MotorMetricas.
+    """
+
+    def __init__(self, diretorio_base):
+        if duckdb is None:
+            raise RuntimeError('HUBSPOT_BACKEND=duckdb precisa do pacote duckdb (pip install duckdb)')
+        diretorio_base = Path(diretorio_base)
+        self._pasta = tempfile.mkdtemp(prefix='hubspot-duckdb-', dir=config.DIR_DUCKDB or None)
+        self._conexao = duckdb.connect(str(Path(self._pasta) / 'consultas.duckdb'), config={
+            'memory_limit': f'{config.DUCKDB_MEMORIA_MB}MB',
+            'temp_directory': str(Path(self._pasta) / 'temporarios'),
+        })
+        # Banco e arquivos temporários somem junto com o motor
+        self._finalizador = weakref.finalize(self, _fechar, self._conexao, self._pasta)
+        self._lock = threading.Lock()
+        self._valores_presentes = {}
+
+        partes_hubspot = str(diretorio_base / 'hubspot' / 'parte-*.parquet')
+        # _linha = posição na leitura das partes em ordem, como no snapshot do pandas; por id
+        # vence a modificação mais recente, depois o arquivo mais novo e a linha mais abaixo
+        # Depois, `duplicado` como em duplicados.duplicados: o lead anterior com o mesmo CPF ou
+        # telefone (por instante de criação, empate pela linha) até a janela antes
+        anteriores = ' OR '.join(
+            f'({chave} IS NOT NULL AND _instante - lag(_instante) OVER ('
+            f'PARTITION BY {chave} ORDER BY _instante NULLS LAST, _linha) <= {janela_ns()})'
+            for chave in CHAVES_CLIENTE
+        )
+        self._conexao.execute(f"""
+            CREATE TABLE hubspot AS
+            SELECT * EXCLUDE (_instante), coalesce({anteriores}, false) AS duplicado FROM (
+                SELECT {_lista(COLUNAS_HUBSPOT)}, _linha, epoch_ns(data) + horario_criado AS _instante FROM (
+                    SELECT *, row_number() OVER (ORDER BY filename, file_row_number) AS _linha
+                    FROM read_parquet(?, union_by_name = true, filename = true, file_row_number = true)
+                )
+                QUALIFY id IS NULL OR row_number() OVER (
+                    PARTITION BY id ORDER BY _modificado_em DESC NULLS LAST, _sequencia DESC, _linha DESC) = 1
+            )
+            ORDER BY _linha
+        """, [partes_hubspot])
+        # O gasto tem "Data" (texto original) e "data": o DuckDB não diferencia maiúsculas nos
+        # nomes, então as colunas são escolhidas pelo pyarrow (o leitor só pode ser lido uma
+        # vez, por isso passa por uma tabela temporária). Por CHAVE_GASTO valem só as linhas
+        # do arquivo mais novo
+        partes_gasto = sorted(str(parte) for parte in (diretorio_base / 'gasto').glob('parte-*.parquet'))
+        leitor = ds.dataset(partes_gasto, format='parquet').scanner(columns=COLUNAS_GASTO + ['_sequencia']).to_reader()
+        self._conexao.register('leitor_gasto', leitor)
+        self._conexao.execute('CREATE TEMP TABLE partes_gasto AS SELECT * FROM leitor_gasto')
+        self._conexao.unregister('leitor_gasto')
+        self._conexao.execute(f"""
+            CREATE TABLE gasto AS
+            SELECT {_lista(COLUNAS_GASTO)} FROM partes_gasto
+            QUALIFY _sequencia = max(_sequencia) OVER (PARTITION BY {_lista(CHAVE_GASTO)})
+        """)
+        self._conexao.execute('DROP TABLE partes_gasto')
+
+    @classmethod
+    def da_base(cls, base):
+        return cls(base.diretorio)
+
+    def consultar(self, sql, parametros=()):
+        # Um cursor por consulta: sessões em threads diferentes não dividem a conexão
+        with self._conexao.cursor() as cursor:
+            return cursor.execute(sql, list(parametros)).df()
+
+    def valores_presentes(self, dimensao):
+        # Valores distintos na ordem em que aparecem, incluindo o nulo (como no pandas)
+        with self._lock:
+            if dimensao not in self._valores_presentes:
+                valores = self.consultar(
+                    f'SELECT {_coluna(dimensao)} AS valor FROM hubspot GROUP BY 1 ORDER BY min(_linha)')['valor']
+                self._valores_presentes[dimensao] = [np.nan if pd.isna(valor) else valor for valor in valores]
+            return list(self._valores_presentes[dimensao])
+
+    def linhas(self):
+        contagens = self.consultar('SELECT (SELECT count(*) FROM hubspot) AS linhas_hubspot, '
+                                   '(SELECT count(*) FROM gasto) AS linhas_gasto')
+        return {coluna: int(valor) for coluna, valor in contagens.iloc[0].items()}
+
+    def memory_usage(self, deep=True):
+        # Memória em uso pelo DuckDB (o resto do banco fica no arquivo temporário)
+        uso = self.consultar('SELECT coalesce(sum(memory_usage_bytes), 0) AS bytes FROM duckdb_memory()')
+        return int(uso['bytes'].iloc[0])
+
+    def periodo_disponivel(self):
+        periodo = self.consultar('SELECT min(data) AS inicio, max(data) AS fim FROM hubspot')
+        return pd.Timestamp(periodo['inicio'].iloc[0]), pd.Timestamp(periodo['fim'].iloc[0])
+
+    def consulta(self, equipe=None, produto=None, convenio_acronimo=None, etapa=None, origem=None,
+                 inicio=None, fim=None, apenas_dias_uteis=True, uf_feriados=None, excluir_duplicados=False):
+        return ConsultaMotor.de_filtro(self, equipe, produto, convenio_acronimo, etapa, origem,
+                                       inicio, fim, apenas_dias_uteis, uf_feriados, excluir_duplicados)
+
+    def celulas(self, selecao, inicio=None, fim=None, calendario=None):
+        # Mesmo cubo de cubo.montar_cubo, só com as linhas do filtro
+        onde, parametros = condicoes(selecao, inicio, fim, calendario)
+        medidas = ', '.join(f'{expressao} AS {medida}' for medida, expressao in MEDIDAS_SQL.items())
+        return self.consultar(f'SELECT {_lista(CHAVES_CUBO)}, {medidas} FROM hubspot WHERE {onde} GROUP BY ALL',
+                              parametros)
+
+    def somas(self, selecao, inicio, fim, calendario, chaves, medidas):
+        # Como CamadaAgregacoes.somas: agrupado por `chaves` em ordem, sem chave nula. Só o
+        # resultado (dezenas a milhares de linhas) sai do banco
+        onde, parametros = condicoes(selecao, inicio, fim, calendario)
+        colunas = ', '.join(f'{MEDIDAS_SQL[medida]} AS {medida}' for medida in medidas)
+        if not chaves:
+            return self.consultar(f'SELECT {colunas} FROM hubspot WHERE {onde}', parametros)
+        sem_nulos = ' AND '.join(f'{_coluna(chave)} IS NOT NULL' for chave in chaves)
+        return self.consultar(f"""
+            SELECT {_lista(chaves)}, {colunas} FROM hubspot WHERE {onde} AND {sem_nulos}
+            GROUP BY ALL ORDER BY {_lista(chaves)}
+        """, parametros)
+
+    def celulas_gasto(self, selecao, inicio=None, fim=None, calendario=None):
+        onde, parametros = condicoes(selecao, inicio, fim, calendario)
+        return self.consultar(f"""
+            SELECT {_lista(CHAVES_CUBO_GASTO)}, coalesce(sum("Quantidade"), 0) AS "Quantidade",
+                   coalesce(sum("Valor Gasto"), 0) AS "Valor Gasto"
+            FROM gasto WHERE {onde} GROUP BY ALL
+        """, parametros)
+
+    def totais_por_dia(self, selecao, selecao_gasto, calendario=None):
+        # Só as colunas que acumulados.montar_indice_diario lê, já somadas por dia
+        onde, parametros = condicoes(selecao, calendario=calendario)
+        hubspot = self.consultar(f"""
+            SELECT data, etapa, count(*) AS leads, coalesce(sum(comissao_gerada), 0) AS comissao_gerada
+            FROM hubspot WHERE {onde} GROUP BY ALL
+        """, parametros)
+        onde, parametros = condicoes(selecao_gasto, calendario=calendario)
+        gasto = self.consultar(f"""
+            SELECT data, "Canal", coalesce(sum("Quantidade"), 0) AS "Quantidade"
+            FROM gasto WHERE {onde} GROUP BY ALL
+        """, parametros)
+        return hubspot, gasto
+
+    def esboco_comissao(self, selecao, inicio=None, fim=None, calendario=None):
+        # Contagem por (convênio, chave do bucket) da comissão projetada: o esboço de quantis
+        # de cada convênio, igual ao que EsbocosQuantis.combinar devolve
+        onde, parametros = condicoes(selecao, inicio, fim, calendario)
+        return self.consultar(f"""
+            SELECT convenio_acronimo, chave, count(*) AS quantidade FROM (
+                SELECT convenio_acronimo, {_chave_quantil_sql('comissao_projetada')} AS chave
+                FROM hubspot WHERE {onde} AND convenio_acronimo IS NOT NULL
+            ) WHERE chave IS NOT NULL GROUP BY ALL
+        """, parametros)
+
+    def esboco_clientes(self, selecao, inicio=None, fim=None, calendario=None):
+        # Maior posto por (pago, registro) dos CPFs do filtro: os esboços HyperLogLog de
+        # todos os leads e dos pagos, como EsbocosDistintos.combinar
+        onde, parametros = condicoes(selecao, inicio, fim, calendario)
+        return self.consultar(f"""
+            SELECT coalesce(etapa = 'PAGO', false) AS pago, registro_cpf AS registro, max(posto_cpf) AS posto
+            FROM hubspot WHERE {onde} AND posto_cpf > 0 GROUP BY ALL
+        """, parametros)
+
+    def contagens_cohort(self, selecao, inicio, fim, calendario, coluna_evento, horizonte, agrupamento):
+        # Por cohort: entradas (deslocamento nulo = sem evento no horizonte) e eventos por
+        # dias após a entrada, como em cohort.montar_cohort
+        onde, parametros = condicoes(selecao, inicio, fim, calendario)
+        evento = _coluna(coluna_evento)
+        deslocamento = f'date_diff(\'day\', CAST(data AS DATE), CAST({evento} AS DATE))'
+        return self.consultar(f"""
+            SELECT {INICIO_COHORT_SQL[agrupamento]} AS cohort,
+                   CASE WHEN {deslocamento} BETWEEN 0 AND {int(horizonte)} THEN {deslocamento} END AS deslocamento,
+                   count(*) AS quantidade
+            FROM hubspot WHERE {onde} AND data IS NOT NULL GROUP BY ALL
+        """, parametros)
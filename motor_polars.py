@@ -0,0 +1,229 @@
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cubo import CHAVES_CUBO, CHAVES_CUBO_GASTO, COLUNAS_GASTO, COLUNAS_HUBSPOT, MEDIDAS_FUNIL
+from duplicados import CHAVES_CLIENTE, janela_ns
+from metricas import ConsultaMotor
+from quantis import CHAVE_ZERO, LOG_GAMA, MAIOR_VALOR, MENOR_BUCKET, MENOR_VALOR
+from tratamento import CHAVE_GASTO
+
+try:
+    import polars as pl
+    import polars.selectors as cs
+except ImportError:  # opcional: só o backend HUBSPOT_BACKEND=polars precisa
+    pl = None
+
+# Início do cohort por agrupamento (semana começa na segunda, como em cohort.py)
+INICIO_COHORT = {'D': '1d', 'W': '1w', 'M': '1mo'}
+
+
+def _medidas():
+    # Medidas do cubo (cubo.montar_cubo) como expressões do Polars; contagens em Int64,
+    # como no pandas
+    return {
+        'leads': pl.len().cast(pl.Int64),
+        'ids': pl.col('id').count().cast(pl.Int64),
+        'comissao_gerada': pl.col('comissao_gerada').sum(),
+        'comissao_projetada': pl.col('comissao_projetada').sum(),
+        **{medida: pl.col(coluna).count().cast(pl.Int64) for coluna, medida in MEDIDAS_FUNIL.items()},
+    }
+
+
+def _chave_quantil(coluna):
+    # Mesma chave de bucket de quantis.chaves (nulo = valor ausente)
+    valor = pl.col(coluna)
+    absoluto = valor.abs().clip(float(MENOR_VALOR), float(MAIOR_VALOR))
+    bucket = (absoluto.log() / float(LOG_GAMA)).ceil().cast(pl.Int64) + (1 - MENOR_BUCKET)
+    return (pl.when(valor.is_null() | valor.is_nan()).then(None)
+            .when(valor == 0).then(CHAVE_ZERO)
+            .when(valor > 0).then(CHAVE_ZERO + bucket)
+            .otherwise(CHAVE_ZERO - bucket))
+
+
+def condicao(selecao, inicio=None, fim=None, calendario=None):
+    """Filtro da barra lateral como expressão do Polars, com a mesma semântica de
+    IndiceFiltros.mascara: seleção None não restringe, nulo selecionado entra e o
+    calendário deixa só os dias úteis (segunda a sexta, menos os feriados dele)."""
+    partes = []
+    if inicio is not None:
+        partes.append(pl.col('data') >= pd.Timestamp(inicio).to_pydatetime())
+    if fim is not None:
+        partes.append(pl.col('data') <= pd.Timestamp(fim).to_pydatetime())
+    for dimensao, selecionados in selecao.items():
+        if selecionados is None:
+            continue
+        # Dimensões em texto; duplicado é booleano
+        valores = [valor if isinstance(valor, bool) else str(valor) for valor in selecionados if not pd.isna(valor)]
+        opcao = pl.col(dimensao).is_in(valores)
+        if len(valores) < len(selecionados):
+            opcao = opcao | pl.col(dimensao).is_null()
+        partes.append(opcao)
+    if calendario is not None:
+        dia = pl.col('data').dt.date()
+        partes.append((pl.col('data').dt.weekday() <= 5) & ~dia.is_in(calendario.feriados.tolist()))
+    return pl.all_horizontal(partes) if partes else pl.lit(True)
+
+
+def _como_texto(frame):
+    # Dimensões como texto: as categorias de partes e arquivos diferentes não se misturam
+    return frame.with_columns(cs.categorical().cast(pl.String))
+
+
+def _marcar_duplicados(frame):
+    # `duplicado` como em duplicados.duplicados: o lead anterior com o mesmo CPF ou telefone
+    # (por instante de criação, empate pela linha) até a janela antes
+    instante = pl.col('data').dt.epoch('ns') + pl.col('horario_criado').dt.total_nanoseconds()
+    anteriores = [
+        pl.col(chave).is_not_null() & (pl.col('_instante') - pl.col('_instante').shift().over(chave) <= janela_ns())
+        for chave in CHAVES_CLIENTE
+    ]
+    return (
+        frame.lazy().with_row_index('_linha').with_columns(_instante=instante)
+        .sort(['_instante', '_linha'], nulls_last=True)
+        .with_columns(duplicado=pl.any_horizontal(anteriores).fill_null(False))
+        .sort('_linha').drop('_linha', '_instante')
+        .collect()
+    )
+
+
+class MotorPolars:
+    """Motor das métricas com o histórico em DataFrames do Polars (HUBSPOT_BACKEND=polars).
+
+    Cada agregação é uma consulta lazy (filtro + group_by) otimizada e executada pelo
+    Polars em paralelo, em todos os núcleos; só o resultado vira pandas, para os gráficos.
+    Montado a partir da base local (leitura das partes Parquet e resolução das linhas
+    repetidas também lazy) ou dos frames já tratados pela ingestão. A interface é a do
+    MotorMetricas.
+    """
+
+    def __init__(self, hubspot, gasto):
+        if pl is None:
+            raise RuntimeError('HUBSPOT_BACKEND=polars precisa do pacote polars (pip install polars)')
+        self.hubspot = _marcar_duplicados(_como_texto(hubspot.select(COLUNAS_HUBSPOT))).rechunk()
+        self.gasto = _como_texto(gasto.select(COLUNAS_GASTO)).rechunk()
+        self._lock = threading.Lock()
+        self._valores_presentes = {}
+
+    @classmethod
+    def da_base(cls, base):
+        diretorio = Path(base.diretorio)
+        partes_hubspot = sorted(str(parte) for parte in (diretorio / 'hubspot').glob('parte-*.parquet'))
+        partes_gasto = sorted(str(parte) for parte in (diretorio / 'gasto').glob('parte-*.parquet'))
+        # _linha = posição na leitura das partes em ordem, como no snapshot do pandas; por id
+        # vence a modificação mais recente, depois o arquivo mais novo e a linha mais abaixo
+        hubspot = (
+            pl.scan_parquet(partes_hubspot, row_index_name='_linha', missing_columns='insert')
+            .with_columns(cs.categorical().cast(pl.String))
+            .filter(pl.col('id').is_null() | (pl.col('_linha') == pl.col('_linha').sort_by(
+                ['_modificado_em', '_sequencia', '_linha'], nulls_last=False).last().over('id')))
+            .sort('_linha')
+        )
+        # Por CHAVE_GASTO valem só as linhas do arquivo mais novo
+        gasto = (
+            pl.scan_parquet(partes_gasto, missing_columns='insert')
+            .with_columns(cs.categorical().cast(pl.String))
+            .filter(pl.col('_sequencia') == pl.col('_sequencia').max().over(CHAVE_GASTO))
+        )
+        # As duas leituras rodam juntas, cada uma em paralelo por parte e por coluna
+        hubspot, gasto = pl.collect_all([hubspot.select(COLUNAS_HUBSPOT), gasto.select(COLUNAS_GASTO)])
+        return cls(hubspot, gasto)
+
+    @classmethod
+    def dos_frames(cls, df_hubspot, df_gasto):
+        # Frames do pandas já tratados (envios sem a base local)
+        return cls(pl.from_pandas(df_hubspot[COLUNAS_HUBSPOT]), pl.from_pandas(df_gasto[COLUNAS_GASTO]))
+
+    def consultar(self, tabela, filtro, *etapas):
+        # Consulta lazy sobre a tabela filtrada; só o resultado chega ao pandas
+        consulta = getattr(self, tabela).lazy().filter(filtro)
+        for etapa in etapas:
+            consulta = etapa(consulta)
+        return consulta.collect().to_pandas()
+
+    def valores_presentes(self, dimensao):
+        # Valores distintos na ordem em que aparecem, incluindo o nulo (como no pandas)
+        with self._lock:
+            if dimensao not in self._valores_presentes:
+                valores = self.hubspot.get_column(dimensao).unique(maintain_order=True).to_list()
+                self._valores_presentes[dimensao] = [np.nan if valor is None else valor for valor in valores]
+            return list(self._valores_presentes[dimensao])
+
+    def linhas(self):
+        return {'linhas_hubspot': self.hubspot.height, 'linhas_gasto': self.gasto.height}
+
+    def memory_usage(self, deep=True):
+        # Tamanho estimado das tabelas do Polars (usado por tamanho_objeto)
+        return int(self.hubspot.estimated_size() + self.gasto.estimated_size())
+
+    def periodo_disponivel(self):
+        datas = self.hubspot.get_column('data')
+        return pd.Timestamp(datas.min()), pd.Timestamp(datas.max())
+
+    def consulta(self, equipe=None, produto=None, convenio_acronimo=None, etapa=None, origem=None,
+                 inicio=None, fim=None, apenas_dias_uteis=True, uf_feriados=None, excluir_duplicados=False):
+        return ConsultaMotor.de_filtro(self, equipe, produto, convenio_acronimo, etapa, origem,
+                                       inicio, fim, apenas_dias_uteis, uf_feriados, excluir_duplicados)
+
+    def celulas(self, selecao, inicio=None, fim=None, calendario=None):
+        # Mesmo cubo de cubo.montar_cubo, só com as linhas do filtro
+        return self.consultar('hubspot', condicao(selecao, inicio, fim, calendario),
+                              lambda consulta: consulta.group_by(CHAVES_CUBO).agg(**_medidas()))
+
+    def somas(self, selecao, inicio, fim, calendario, chaves, medidas):
+        # Como CamadaAgregacoes.somas: agrupado por `chaves` em ordem, sem chave nula
+        expressoes = {medida: expressao for medida, expressao in _medidas().items() if medida in medidas}
+        filtro = condicao(selecao, inicio, fim, calendario)
+        if not chaves:
+            return self.consultar('hubspot', filtro, lambda consulta: consulta.select(**expressoes))
+        filtro = filtro & pl.all_horizontal(pl.col(chave).is_not_null() for chave in chaves)
+        return self.consultar('hubspot', filtro,
+                              lambda consulta: consulta.group_by(chaves).agg(**expressoes).sort(chaves))
+
+    def celulas_gasto(self, selecao, inicio=None, fim=None, calendario=None):
+        return self.consultar('gasto', condicao(selecao, inicio, fim, calendario),
+                              lambda consulta: consulta.group_by(CHAVES_CUBO_GASTO).agg(
+                                  pl.col('Quantidade').sum(), pl.col('Valor Gasto').sum()))
+
+    def totais_por_dia(self, selecao, selecao_gasto, calendario=None):
+        # Só as colunas que acumulados.montar_indice_diario lê, já somadas por dia
+        hubspot = self.consultar('hubspot', condicao(selecao, calendario=calendario),
+                                 lambda consulta: consulta.group_by(['data', 'etapa']).agg(
+                                     leads=pl.len().cast(pl.Int64), comissao_gerada=pl.col('comissao_gerada').sum()))
+        gasto = self.consultar('gasto', condicao(selecao_gasto, calendario=calendario),
+                               lambda consulta: consulta.group_by(['data', 'Canal']).agg(pl.col('Quantidade').sum()))
+        return hubspot, gasto
+
+    def esboco_comissao(self, selecao, inicio=None, fim=None, calendario=None):
+        # Contagem por (convênio, chave do bucket) da comissão projetada: o esboço de quantis
+        # de cada convênio, igual ao que EsbocosQuantis.combinar devolve
+        filtro = condicao(selecao, inicio, fim, calendario) & pl.col('convenio_acronimo').is_not_null()
+        return self.consultar('hubspot', filtro, lambda consulta: (
+            consulta.select('convenio_acronimo', chave=_chave_quantil('comissao_projetada'))
+            .drop_nulls('chave')
+            .group_by(['convenio_acronimo', 'chave']).agg(quantidade=pl.len().cast(pl.Int64))
+        ))
+
+    def esboco_clientes(self, selecao, inicio=None, fim=None, calendario=None):
+        # Maior posto por (pago, registro) dos CPFs do filtro: os esboços HyperLogLog de
+        # todos os leads e dos pagos, como EsbocosDistintos.combinar
+        filtro = condicao(selecao, inicio, fim, calendario) & (pl.col('posto_cpf') > 0)
+        return self.consultar('hubspot', filtro, lambda consulta: (
+            consulta.group_by(pago=(pl.col('etapa') == 'PAGO').fill_null(False), registro=pl.col('registro_cpf'))
+            .agg(posto=pl.col('posto_cpf').max())
+        ))
+
+    def contagens_cohort(self, selecao, inicio, fim, calendario, coluna_evento, horizonte, agrupamento):
+        # Por cohort: entradas (deslocamento nulo = sem evento no horizonte) e eventos por
+        # dias após a entrada, como em cohort.montar_cohort
+        filtro = condicao(selecao, inicio, fim, calendario) & pl.col('data').is_not_null()
+        deslocamento = (pl.col(coluna_evento).dt.date() - pl.col('data').dt.date()).dt.total_days()
+        return self.consultar('hubspot', filtro, lambda consulta: (
+            consulta.select(
+                cohort=pl.col('data').dt.truncate(INICIO_COHORT[agrupamento]).cast(pl.Datetime('ns')),
+                deslocamento=pl.when(deslocamento.is_between(0, int(horizonte))).then(deslocamento),
+            )
+            .group_by(['cohort', 'deslocamento']).agg(quantidade=pl.len().cast(pl.Int64))
+        ))
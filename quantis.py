@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+# Erro relativo máximo dos quantis (esboço com buckets logarítmicos, estilo DDSketch)
+ERRO_RELATIVO = 0.01
+GAMA = (1 + ERRO_RELATIVO) / (1 - ERRO_RELATIVO)
+LOG_GAMA = np.log(GAMA)
+
+# Faixa de |valor| representada; fora dela o valor é limitado às pontas
+MENOR_VALOR, MAIOR_VALOR = 1e-6, 1e12
+MENOR_BUCKET = int(np.ceil(np.log(MENOR_VALOR) / LOG_GAMA))
+MAIOR_BUCKET = int(np.ceil(np.log(MAIOR_VALOR) / LOG_GAMA))
+
+# Chaves em ordem de valor: negativos, zero, positivos
+DESLOCAMENTO = MAIOR_BUCKET - MENOR_BUCKET + 1
+CHAVE_ZERO = DESLOCAMENTO
+NUMERO_CHAVES = 2 * DESLOCAMENTO + 1
+
+# Pontos discrepantes enviados ao gráfico por grupo
+MAX_OUTLIERS_POR_GRUPO = 50
+
+
+def chaves(valores):
+    # Valor -> chave do bucket (-1 = valor ausente)
+    valores = np.asarray(valores, dtype='float64')
+    absolutos = np.clip(np.abs(valores), MENOR_VALOR, MAIOR_VALOR)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        buckets = np.ceil(np.log(absolutos) / LOG_GAMA)
+    buckets = np.nan_to_num(buckets, nan=MENOR_BUCKET).astype('int64') - MENOR_BUCKET + 1
+    resultado = np.where(valores > 0, CHAVE_ZERO + buckets, CHAVE_ZERO - buckets)
+    resultado[valores == 0] = CHAVE_ZERO
+    resultado[np.isnan(valores)] = -1
+    return resultado
+
+
+def valores_das_chaves(chaves_bucket):
+    # Chave -> valor representativo do bucket (meio do intervalo em escala relativa)
+    chaves_bucket = np.asarray(chaves_bucket, dtype='int64')
+    buckets = np.abs(chaves_bucket - CHAVE_ZERO) + MENOR_BUCKET - 1
+    modulo = 2 * np.exp(buckets * LOG_GAMA) / (GAMA + 1)
+    return np.where(chaves_bucket == CHAVE_ZERO, 0.0, np.sign(chaves_bucket - CHAVE_ZERO) * modulo)
+
+
+class EsbocosQuantis:
+    """Um esboço de quantis por célula do cubo, guardado como tabela (célula, chave, contagem).
+
+    Montado uma vez junto do cubo. Esboços são combináveis: somar as contagens das
+    células selecionadas, por grupo e chave, dá o esboço do grupo, e os quantis saem
+    dele com erro relativo de ERRO_RELATIVO, sem reler as linhas.
+    """
+
+    def __init__(self, celula_por_linha, valores, numero_celulas):
+        chave_linha = chaves(valores)
+        validas = chave_linha >= 0
+        combinadas = celula_por_linha[validas].astype('int64') * NUMERO_CHAVES + chave_linha[validas]
+        unicas, contagens = np.unique(combinadas, return_counts=True)
+        self.celula = (unicas // NUMERO_CHAVES).astype('int64')
+        self.chave = (unicas % NUMERO_CHAVES).astype('int32')
+        self.contagem = contagens.astype('int64')
+        self.numero_celulas = numero_celulas
+
+    def memory_usage(self, deep=True):
+        return self.celula.nbytes + self.chave.nbytes + self.contagem.nbytes
+
+    def combinar(self, posicoes_celulas, grupo_por_celula, numero_grupos):
+        # Contagens (numero_grupos × NUMERO_CHAVES) das células selecionadas, somadas por grupo
+        selecionada = np.zeros(self.numero_celulas, dtype=bool)
+        selecionada[posicoes_celulas] = True
+        linhas = selecionada[self.celula]
+        grupos = grupo_por_celula[self.celula[linhas]]
+        validas = grupos >= 0
+        indices = grupos[validas].astype('int64') * NUMERO_CHAVES + self.chave[linhas][validas]
+        contagens = np.bincount(indices, weights=self.contagem[linhas][validas], minlength=numero_grupos * NUMERO_CHAVES)
+        return contagens.reshape(numero_grupos, NUMERO_CHAVES)
+
+
+def resumo_boxplot(contagens, rotulos):
+    """Quartis, cercas (1,5 × IQR, limitadas ao menor/maior valor dentro delas) e uma
+    amostra de pontos discrepantes por grupo, a partir das contagens combinadas."""
+    representantes = valores_das_chaves(np.arange(NUMERO_CHAVES))
+    resumo, outliers = [], []
+    for grupo in np.flatnonzero(contagens.sum(axis=1)):
+        linha = contagens[grupo]
+        presentes = np.flatnonzero(linha)
+        valores, pesos = representantes[presentes], linha[presentes]
+        acumulado = np.cumsum(pesos)
+        total = acumulado[-1]
+
+        def quantil(q):
+            return valores[np.searchsorted(acumulado, q * total, side='left')]
+
+        q1, mediana, q3 = quantil(0.25), quantil(0.5), quantil(0.75)
+        iqr = q3 - q1
+        dentro = (valores >= q1 - 1.5 * iqr) & (valores <= q3 + 1.5 * iqr)
+        resumo.append({
+            'grupo': rotulos[grupo], 'n': int(total),
+            'q1': q1, 'mediana': mediana, 'q3': q3,
+            'cerca_inferior': valores[dentro].min(), 'cerca_superior': valores[dentro].max(),
+        })
+        # Os mais extremos primeiro, até o limite
+        fora = np.flatnonzero(~dentro)
+        fora = fora[np.argsort(-np.abs(valores[fora] - mediana), kind='stable')][:MAX_OUTLIERS_POR_GRUPO]
+        outliers += [{'grupo': rotulos[grupo], 'valor': valores[i], 'quantidade': int(pesos[i])} for i in fora]
+    return (pd.DataFrame(resumo, columns=['grupo', 'n', 'q1', 'mediana', 'q3', 'cerca_inferior', 'cerca_superior']),
+            pd.DataFrame(outliers, columns=['grupo', 'valor', 'quantidade']))
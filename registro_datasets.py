@@ -0,0 +1,150 @@
+import threading
+import weakref
+from collections import OrderedDict, deque
+
+import config
+from cache import esquecer, tamanho_objeto
+
+
+class ReferenciaDataset:
+    """Posse de um dataset do registro por uma sessão.
+
+    Enquanto existir, o dataset não sai do registro. `liberar` devolve a posse; se a
+    sessão terminar sem liberar, a posse é devolvida quando o objeto é coletado.
+    """
+
+    def __init__(self, registro, chave, valor):
+        self.chave = chave
+        self.valor = valor
+        # O finalizador não guarda a referência em si, só o registro e a chave
+        self._finalizador = weakref.finalize(self, registro.liberar, chave)
+
+    def liberar(self):
+        # Idempotente: o finalizador roda uma vez só
+        self._finalizador()
+
+
+class RegistroDatasets:
+    """Datasets compartilhados por todas as sessões do processo, pela chave do conteúdo.
+
+    Cada sessão adquire uma referência ao dataset que está usando; sessões com os mesmos
+    arquivos recebem o mesmo objeto, montado uma vez só. Os datasets são somente leitura:
+    quem usa deriva frames novos (filtros são vetores de posições) e nunca altera o
+    compartilhado. Sem nenhuma referência, o dataset fica ocioso e os mais antigos além
+    de `max_ociosos` são descartados; datasets em uso nunca são.
+    """
+
+    def __init__(self, max_ociosos=2, medir_tamanho=tamanho_objeto):
+        self.max_ociosos = max_ociosos
+        self.medir_tamanho = medir_tamanho
+        self._lock = threading.Lock()
+        self._valores = {}
+        self._tamanhos = {}
+        self._referencias = {}
+        # Sem referências, do mais antigo para o mais recente
+        self._ociosos = OrderedDict()
+        # Referências devolvidas ainda não contadas (ver liberar)
+        self._liberadas = deque()
+        # Um lock por chave em montagem: duas sessões pedindo o mesmo dataset novo
+        # esperam uma única montagem em vez de criar duas cópias
+        self._montagens = {}
+        self.montagens = 0
+        self.reaproveitamentos = 0
+        self.descartes = 0
+
+    def __contains__(self, chave):
+        with self._lock:
+            return chave in self._valores
+
+    def liberar(self, chave):
+        # Pode rodar dentro do coletor de lixo, a qualquer momento (até com o lock tomado
+        # nesta mesma thread): só anota, e a contagem é atualizada na próxima operação
+        self._liberadas.append(chave)
+
+    def _contar_liberadas(self):
+        # Chamado com o lock tomado
+        while self._liberadas:
+            chave = self._liberadas.popleft()
+            if chave not in self._referencias:
+                continue
+            self._referencias[chave] -= 1
+            if self._referencias[chave] > 0:
+                continue
+            del self._referencias[chave]
+            self._ociosos[chave] = None
+        while len(self._ociosos) > self.max_ociosos:
+            antiga, _ = self._ociosos.popitem(last=False)
+            self._descartar(antiga)
+
+    def _descartar(self, chave):
+        valor = self._valores.pop(chave)
+        del self._tamanhos[chave]
+        # Sai também dos caches por identidade (frames alinhados, cubos, agregações), para
+        # a memória do dataset ser de fato liberada; o que outro dataset usa fica
+        esquecer([valor], em_uso=list(self._valores.values()))
+        self.descartes += 1
+
+    def _referenciar(self, chave):
+        # Chamado com o lock tomado
+        self._referencias[chave] = self._referencias.get(chave, 0) + 1
+        self._ociosos.pop(chave, None)
+        return ReferenciaDataset(self, chave, self._valores[chave])
+
+    def adquirir(self, chave, montar):
+        with self._lock:
+            self._contar_liberadas()
+            if chave in self._valores:
+                self.reaproveitamentos += 1
+                return self._referenciar(chave)
+            lock_montagem = self._montagens.setdefault(chave, threading.Lock())
+
+        with lock_montagem:
+            with self._lock:
+                if chave in self._valores:
+                    self.reaproveitamentos += 1
+                    return self._referenciar(chave)
+            # A montagem roda fora do lock geral: outros datasets seguem disponíveis
+            try:
+                valor = montar()
+            except BaseException:
+                with self._lock:
+                    self._montagens.pop(chave, None)
+                raise
+            tamanho = self.medir_tamanho(valor)
+            with self._lock:
+                self._valores[chave] = valor
+                self._tamanhos[chave] = tamanho
+                self._montagens.pop(chave, None)
+                self.montagens += 1
+                return self._referenciar(chave)
+
+    def limpar_ociosos(self):
+        with self._lock:
+            self._contar_liberadas()
+            for chave in self._ociosos:
+                self._descartar(chave)
+            self._ociosos.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            self._contar_liberadas()
+            datasets = [
+                {
+                    'chave': chave[:12],
+                    'sessoes': self._referencias.get(chave, 0),
+                    'mb': round(self._tamanhos[chave] / 1024 ** 2, 1),
+                }
+                for chave in self._valores
+            ]
+            return {
+                'datasets': datasets,
+                'mb_total': round(sum(self._tamanhos.values()) / 1024 ** 2, 1),
+                'max_ociosos': self.max_ociosos,
+                'montagens': self.montagens,
+                'reaproveitamentos': self.reaproveitamentos,
+                'descartes': self.descartes,
+            }
+
+
+# Um registro por processo, compartilhado por todas as sessões do Streamlit
+registro = RegistroDatasets(max_ociosos=config.DATASETS_OCIOSOS)
@@ -0,0 +1,93 @@
+"""Calcula as métricas do painel sem Streamlit e grava em JSON ou Parquet (relatórios em lote).
+
+Uso:
+    python relatorio.py --hubspot hubspot.csv --gasto gasto.csv --saida relatorio/
+    python relatorio.py --hubspot hubspot.csv --gasto gasto.csv --filtro filtro.json --formato parquet
+
+O filtro (opcional) é um JSON com as mesmas opções da barra lateral, por exemplo:
+    {"produto": ["Novo"], "inicio": "2025-03-01", "fim": "2025-03-31",
+     "apenas_dias_uteis": true, "uf_feriados": "SP"}
+"""
+import argparse
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from cohort import AGRUPAMENTOS
+from metricas import EVENTOS_COHORT, MotorMetricas
+
+
+def _para_json(valor):
+    if isinstance(valor, pd.Timestamp):
+        return valor.date().isoformat()
+    if hasattr(valor, 'item'):
+        return valor.item()
+    return valor
+
+
+def _tabela_para_gravar(tabela):
+    # Parquet/JSON pedem nomes de coluna em texto; o índice com significado vira coluna
+    if not isinstance(tabela.index, pd.RangeIndex):
+        tabela = tabela.reset_index()
+    tabela = tabela.copy()
+    tabela.columns = [str(coluna) for coluna in tabela.columns]
+    return tabela
+
+
+def gravar(resultado, saida, formato):
+    saida = Path(saida)
+    saida.mkdir(parents=True, exist_ok=True)
+    kpis = {chave: _para_json(valor) for chave, valor in resultado['kpis'].items()}
+    tabelas = {nome: _tabela_para_gravar(tabela) for nome, tabela in resultado.items() if nome != 'kpis'}
+
+    if formato == 'json':
+        conteudo = {'kpis': kpis}
+        for nome, tabela in tabelas.items():
+            conteudo[nome] = json.loads(tabela.to_json(orient='records', date_format='iso', force_ascii=False))
+        (saida / 'metricas.json').write_text(json.dumps(conteudo, ensure_ascii=False, indent=1), encoding='utf-8')
+        return [saida / 'metricas.json']
+
+    (saida / 'kpis.json').write_text(json.dumps(kpis, ensure_ascii=False, indent=1), encoding='utf-8')
+    arquivos = [saida / 'kpis.json']
+    for nome, tabela in tabelas.items():
+        # Categorias viram texto para o arquivo não depender do dicionário deste dataset
+        tabela = tabela.astype({coluna: str for coluna in tabela.select_dtypes('category').columns})
+        tabela.to_parquet(saida / f'{nome}.parquet', index=False)
+        arquivos.append(saida / f'{nome}.parquet')
+    return arquivos
+
+
+def main():
+    # Copy-on-write, como no painel (hubspot.py)
+    pd.set_option('mode.copy_on_write', True)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hubspot', required=True, help='CSV exportado do HubSpot')
+    parser.add_argument('--gasto', required=True, help='CSV de gasto (separado por ;)')
+    parser.add_argument('--filtro', help='JSON com o filtro (padrão: tudo, só dias úteis)')
+    parser.add_argument('--saida', default='relatorio', help='Pasta de saída')
+    parser.add_argument('--formato', choices=['json', 'parquet'], default='json')
+    parser.add_argument('--top-n', type=int, default=10)
+    parser.add_argument('--evento-cohort', choices=list(EVENTOS_COHORT), default='Pagamento')
+    parser.add_argument('--horizonte-cohort', type=int, default=None)
+    parser.add_argument('--agrupamento-cohort', choices=list(AGRUPAMENTOS), default='Dia')
+    args = parser.parse_args()
+
+    filtro = {}
+    if args.filtro:
+        filtro = json.loads(Path(args.filtro).read_text(encoding='utf-8'))
+
+    motor = MotorMetricas.de_arquivos(args.hubspot, args.gasto)
+    consulta = motor.consulta(**filtro)
+    resultado = consulta.relatorio(
+        top_n=args.top_n,
+        coluna_evento=EVENTOS_COHORT[args.evento_cohort],
+        horizonte=args.horizonte_cohort,
+        agrupamento=AGRUPAMENTOS[args.agrupamento_cohort],
+    )
+    for arquivo in gravar(resultado, args.saida, args.formato):
+        print(arquivo)
+
+
+if __name__ == '__main__':
+    main()
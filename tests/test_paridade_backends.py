@@ -0,0 +1,75 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+RAIZ = Path(__file__).resolve().parents[1]
+sys.path[:0] = [str(RAIZ), str(RAIZ / 'benchmarks')]
+
+from base_local import BaseLocal  # noqa: E402
+from cohort import AGRUPAMENTOS  # noqa: E402
+from comparar_backends import BACKENDS, DEPENDENCIAS, diferencas, filtros_de_teste  # noqa: E402
+from gerar_dados import gerar_arquivos  # noqa: E402
+from ingestao import carregar_arquivos  # noqa: E402
+from metricas import EVENTOS_COHORT  # noqa: E402
+
+# Pequeno o bastante para rodar em segundos, com leads repetidos e perdas em todo o período
+LINHAS = 20_000
+
+
+@pytest.fixture(scope='module')
+def base(tmp_path_factory):
+    caminhos = gerar_arquivos(LINHAS, tmp_path_factory.mktemp('dados'), dias=120)
+    base = BaseLocal(tmp_path_factory.mktemp('base'))
+    for tabela, caminho in zip(['hubspot', 'gasto'], caminhos):
+        base.adicionar(tabela, caminho.read_bytes(), caminho.name)
+    return base
+
+
+@pytest.fixture(scope='module')
+def motor_pandas(base):
+    return BACKENDS['pandas'](base)
+
+
+@pytest.fixture(scope='module', params=[nome for nome in BACKENDS if nome != 'pandas'])
+def motor(request, base):
+    # Backend opcional sem o pacote instalado: os testes dele são pulados
+    if DEPENDENCIAS[request.param] is None:
+        pytest.skip(f'{request.param} não instalado')
+    return BACKENDS[request.param](base)
+
+
+def test_relatorio_igual_ao_pandas(motor_pandas, motor):
+    assert motor.linhas() == motor_pandas.linhas()
+    assert motor.periodo_disponivel() == motor_pandas.periodo_disponivel()
+
+    divergencias = []
+    for nome_filtro, filtro in filtros_de_teste(motor_pandas).items():
+        for agrupamento in AGRUPAMENTOS.values():
+            for coluna_evento in [EVENTOS_COHORT['Pagamento'], EVENTOS_COHORT['Perda']]:
+                parametros = {'agrupamento': agrupamento, 'coluna_evento': coluna_evento}
+                esperado = motor_pandas.consulta(**filtro).relatorio(**parametros)
+                obtido = motor.consulta(**filtro).relatorio(**parametros)
+                divergencias += [f'{nome_filtro} {agrupamento} {coluna_evento} {texto}'
+                                 for tabela, saida in esperado.items()
+                                 for texto in diferencas(saida, obtido[tabela], tabela)]
+    assert not divergencias, '\n'.join(divergencias[:20])
+
+
+@pytest.mark.parametrize('dimensao', ['equipe', 'produto', 'convenio_acronimo', 'etapa', 'origem'])
+def test_valores_dos_filtros_iguais(motor_pandas, motor, dimensao):
+    assert [str(valor) for valor in motor.valores_presentes(dimensao)] == \
+        [str(valor) for valor in motor_pandas.valores_presentes(dimensao)]
+
+
+def test_envio_com_ids_repetidos_igual_a_base(tmp_path):
+    # Um arquivo só, com o mesmo negócio exportado duas vezes: o envio resolve os ids
+    # repetidos como a base local
+    caminho_hubspot, _ = gerar_arquivos(2_000, tmp_path / 'dados', dias=30)
+    linhas = caminho_hubspot.read_bytes().splitlines(keepends=True)
+    conteudo = b''.join(linhas + linhas[1:11])
+    base = BaseLocal(tmp_path / 'base')
+    base.adicionar('hubspot', conteudo, 'hubspot.csv')
+    df_hubspot, _, _ = carregar_arquivos([('hubspot.csv', conteudo)])
+    assert df_hubspot['id'].is_unique
+    assert df_hubspot['id'].tolist() == base.carregar('hubspot')['id'].tolist()
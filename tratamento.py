@@ -0,0 +1,319 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+import config
+from datas import parser_gasto, parser_hubspot
+from distintos import registros
+
+# Incrementar sempre que o tratamento mudar, para invalidar o cache de ingestão
+VERSAO_TRATAMENTO = '9'
+
+MAPA_COLUNAS = {
+    'ID do registro.': 'id',
+    'Nome do negócio': 'nome',
+    'Data de criação': 'data_criado',
+    'CPF': 'cpf',
+    'Telefone': 'telefone',
+    'Convênio': 'convenio',
+    'Origem': 'origem',
+    'Campanha': 'tag_campanha',
+    'Proprietário original do negócio': 'vendedor',
+    'Tipo de Campanha': 'produto',
+    'Equipe da HubSpot': 'equipe',
+    'Etapa do negócio': 'etapa',
+    'Motivo de fechamento perdido': 'motivo_fechamento',
+    'Comissão total projetada': 'comissao_projetada',
+    'Valor': 'comissao_gerada',
+    'Proprietário do negócio': 'vendedor2',
+    'Date entered "CONTRATAÇÃO ( Pipeline de Vendas)"': 'data_contratacao',
+    'Date entered "LEAD ( Pipeline de Vendas)"': 'data_lead',
+    'Date entered "NEGOCIAÇÃO ( Pipeline de Vendas)"': 'data_negociacao',
+    'Date entered "PAGO ( Pipeline de Vendas)"': 'data_pago',
+    'Date entered "PERDA ( Pipeline de Vendas)"': 'data_perda',
+    'Detalhes do motivo de perda': 'detalhe_perda'
+}
+
+MOTIVOS_PRINCIPAIS = frozenset([
+    'Sem Interação', 'Telefone Inválido', 'Sem interesse', 'Sem oportunidade',
+    'Lead respondeu "NÃO" ao disparo', 'Vínculo inadequado', 'Desistência do Cliente',
+    'Sem interação; Sem interesse', 'Não atende', 'Não receber mensagens - LGPD',
+    'Margem Insuficiente'
+])
+
+ACRONIMOS_CONVENIO = {
+    'prefeitura de recife': 'PREF REC',
+    'prefeitura de curitiba': 'PREF CUR',
+    'prefeitura de maringá': 'PREF MAR',
+    'prefeitura de goiânia': 'PREF GOI',
+    'prefeitura de belo horizonte': 'PREF BH',
+    'governo de rondônia': 'GOV RO',
+    'governo do paraná': 'GOV PR',
+    'prefeitura de são paulo': 'PREF SP',
+    'governo de são paulo': 'GOV SP',
+    'prefeitura do rio de janeiro': 'PREF RJ',
+    'governo do rio de janeiro': 'GOV RJ',
+    'prefeitura de salvador': 'PREF SSA',
+    'governo da bahia': 'GOV BA',
+    'governo de alagoas': 'GOV AL',
+    'governo do amazonas': 'GOV AM',
+    'governo do maranhão': 'GOV MA',
+    'governo de goiás': 'GOV GO',
+    'governo do ceará': 'GOV CE',
+    'governo de pernambuco': 'GOV PE',
+    'governo de mato grosso do sul': 'GOV MS',
+    'governo de mato grosso': 'GOV MT',
+    'governo do piauí': 'GOV PI',
+    'prefeitura de joão pessoa': 'PREF JP'
+}
+
+# (trecho procurado, equipe normalizada) - em caso de mais de um trecho, vale o primeiro
+# da lista (ex.: 'Sales Cs App' é Sales), como nas substituições em sequência de antes
+REGRAS_EQUIPE = [
+    ('sales', 'Sales'),
+    ('cs ativação', 'Cs Ativacao'),
+    ('cs app', 'Cs App'),
+]
+
+PRECO_CANAL = {'SMS': 0.047, 'RCS': 0.105}
+
+# Datas de entrada em cada etapa, guardadas como datetime64 (meia-noite do dia)
+COLUNAS_DATA_ETAPA = ['data_lead', 'data_negociacao', 'data_contratacao', 'data_pago', 'data_perda']
+
+# Chave natural das linhas de gasto (não há id): para cada chave valem só as linhas do
+# arquivo mais novo que a contém (repetições dentro do mesmo arquivo são mantidas)
+CHAVE_GASTO = ['data', 'Canal', 'Convênio', 'Produto', 'Equipe']
+
+# Colunas que algum painel usa; na ingestão em blocos só elas são lidas do CSV
+COLUNAS_NECESSARIAS = [
+    'id', 'data_criado', 'cpf', 'telefone', 'convenio', 'origem', 'vendedor', 'produto', 'equipe', 'etapa',
+    'motivo_fechamento', 'comissao_projetada', 'comissao_gerada', 'data_contratacao',
+    'data_lead', 'data_negociacao', 'data_pago', 'data_perda',
+]
+
+# dtypes explícitos por cabeçalho original (datas chegam como texto e são tratadas depois)
+DTYPES_HUBSPOT = {
+    'ID do registro.': 'Int64',
+    'CPF': 'string',
+    'Telefone': 'string',
+    'Convênio': 'category',
+    'Origem': 'category',
+    'Proprietário original do negócio': 'category',
+    'Tipo de Campanha': 'category',
+    'Equipe da HubSpot': 'category',
+    'Etapa do negócio': 'category',
+    'Motivo de fechamento perdido': 'category',
+    'Comissão total projetada': 'float64',
+    'Valor': 'float64',
+}
+
+# Dimensões com poucas dezenas de valores distintos, guardadas como category
+COLUNAS_DIMENSAO = ['equipe', 'produto', 'convenio', 'convenio_acronimo', 'etapa', 'origem',
+                    'motivo_fechamento', 'motivo_fechamento_agrupado', 'vendedor']
+COLUNAS_DIMENSAO_GASTO = ['Convênio', 'Produto', 'Canal', 'Equipe']
+
+# Colunas do HubSpot e do gasto que compartilham o mesmo dicionário de categorias
+DIMENSOES_COMPARTILHADAS = [
+    ('convenio_acronimo', 'Convênio'),
+    ('produto', 'Produto'),
+    ('origem', 'Canal'),
+    ('equipe', 'Equipe'),
+]
+
+
+def mapear_unicos(serie, funcao):
+    # Aplica `funcao` uma vez por valor distinto e espalha o resultado pelos códigos
+    codigos, unicos = pd.factorize(serie)
+    valores = np.empty(len(unicos) + 1, dtype=object)
+    valores[:-1] = [funcao(valor) for valor in unicos]
+    valores[-1] = funcao(np.nan)  # código -1 (valor ausente) cai na última posição
+    resultado = valores[codigos]
+    if pd.isna(valores[-1]):
+        # Ausentes continuam com o mesmo nulo da entrada (None ou NaN)
+        ausentes = codigos == -1
+        resultado[ausentes] = serie.to_numpy()[ausentes]
+    return pd.Series(resultado, index=serie.index, name=serie.name)
+
+
+def agrupar_motivo(motivo):
+    return motivo if motivo in MOTIVOS_PRINCIPAIS else 'Outros'
+
+
+def criar_acronimo(convenio):
+    convenio = convenio.lower() if isinstance(convenio, str) else ''
+    return ACRONIMOS_CONVENIO.get(convenio, convenio)
+
+
+def normalizar_equipe(equipe):
+    if not isinstance(equipe, str):
+        return equipe
+    equipe_minuscula = equipe.lower()
+    for trecho, normalizada in REGRAS_EQUIPE:
+        if trecho in equipe_minuscula:
+            return normalizada
+    return equipe
+
+
+def _digitos(serie, tirar_ddi=False):
+    # Só os dígitos, como Int64 (com ou sem máscara é o mesmo valor); vazio ou zero = ausente.
+    # `tirar_ddi`: o 55 do Brasil na frente de 10 ou 11 dígitos sai (telefone)
+    if pd.api.types.is_numeric_dtype(serie):
+        # Coluna lida como número (sem máscara no arquivo): sem passar por texto
+        numeros = serie.astype('Int64')
+        if tirar_ddi:
+            for tamanho in (12, 13):
+                divisor = 10 ** (tamanho - 2)
+                com_ddi = (numeros >= 55 * divisor) & (numeros < 56 * divisor)
+                numeros = numeros.mask(com_ddi, numeros % divisor)
+        return numeros.where(numeros > 0)
+    # Texto no Arrow: o regex roda em C sobre o buffer, sem uma string Python por linha
+    texto = serie.astype('string[pyarrow]').str.replace('[^0-9]+', '', regex=True)
+    if tirar_ddi:
+        com_ddi = texto.str.startswith('55') & texto.str.len().isin([12, 13])
+        texto = texto.mask(com_ddi, texto.str.slice(2))
+    # Mais de 18 dígitos não cabe no int64 (e não é CPF nem telefone)
+    texto = texto.where(texto.str.len().between(1, 18))
+    numeros = texto.astype('int64[pyarrow]').astype('Int64')
+    return numeros.where(numeros > 0)
+
+
+def normalizar_cpf(serie):
+    return _digitos(serie)
+
+
+def normalizar_telefone(serie):
+    # DDD + número
+    return _digitos(serie, tirar_ddi=True)
+
+
+def memoria_como_object(categorica):
+    # O que memory_usage(deep=True) daria para a coluna como object, calculado pelos
+    # códigos (varrer os objetos custaria mais que a própria conversão)
+    categorias = categorica.cat.categories
+    contagens = np.bincount(categorica.cat.codes.to_numpy() + 1, minlength=len(categorias) + 1)
+    tamanhos = np.array([sys.getsizeof(np.nan)] + [sys.getsizeof(valor) for valor in categorias])
+    return int(len(categorica) * 8 + contagens @ tamanhos)
+
+
+def converter_dimensoes(dataframe, colunas):
+    # Converte as dimensões para category e guarda o uso de memória anterior em attrs
+    colunas = [coluna for coluna in colunas if coluna in dataframe.columns]
+    memoria_antes = dataframe.attrs.setdefault('memoria_antes', {})
+    for coluna in colunas:
+        dataframe[coluna] = dataframe[coluna].astype('category')
+        memoria_antes[coluna] = memoria_como_object(dataframe[coluna])
+    return dataframe
+
+
+def relatorio_memoria(dataframe):
+    # Memória por coluna antes e depois da conversão para category (em MB);
+    # colunas não convertidas entram com o mesmo valor nos dois lados
+    depois = dataframe.memory_usage(deep=True).astype('float64')
+    antes = depois.copy()
+    for coluna, bytes_ in dataframe.attrs.get('memoria_antes', {}).items():
+        antes[coluna] = bytes_
+    relatorio = pd.DataFrame({'antes_mb': antes, 'depois_mb': depois}) / 1024 ** 2
+    relatorio.loc['TOTAL'] = relatorio.sum()
+    relatorio['reducao_%'] = (1 - relatorio['depois_mb'] / relatorio['antes_mb']).mul(100).where(relatorio['antes_mb'] > 0, 0)
+    return relatorio.round(2)
+
+
+def concatenar_blocos(blocos):
+    # Concatena blocos já tratados; as categorias de cada coluna são unidas antes
+    # para o resultado continuar category (concat de categorias diferentes vira object)
+    blocos = list(blocos)
+    if len(blocos) == 1:
+        return blocos[0]
+    for coluna in blocos[0].columns:
+        if not all(isinstance(bloco[coluna].dtype, pd.CategoricalDtype) for bloco in blocos):
+            continue
+        categorias = blocos[0][coluna].cat.categories
+        for bloco in blocos[1:]:
+            categorias = categorias.union(bloco[coluna].cat.categories)
+        for bloco in blocos:
+            bloco[coluna] = bloco[coluna].cat.set_categories(categorias)
+    memoria_antes = {}
+    for bloco in blocos:
+        for coluna, bytes_ in bloco.attrs.get('memoria_antes', {}).items():
+            memoria_antes[coluna] = memoria_antes.get(coluna, 0) + bytes_
+    resultado = pd.concat(blocos, ignore_index=True)
+    resultado.attrs['memoria_antes'] = memoria_antes
+    return resultado
+
+
+def modificado_em(dataframe):
+    # Última data conhecida do negócio (criação ou entrada em alguma etapa)
+    return dataframe[['data'] + COLUNAS_DATA_ETAPA].max(axis=1)
+
+
+def resolver_repetidos(tabela, dataframe):
+    # Linhas de vários arquivos, marcadas com `_sequencia` (ordem do arquivo) e, no HubSpot,
+    # `_modificado_em`: por id vence a modificação mais recente (empate: arquivo mais novo);
+    # no gasto, por CHAVE_GASTO vence o arquivo mais novo
+    if tabela == 'hubspot':
+        ordenado = dataframe.sort_values(['_modificado_em', '_sequencia'], kind='stable', na_position='first')
+        com_id = ordenado['id'].notna()
+        repetido = ordenado['id'].duplicated(keep='last') & com_id
+        return ordenado[~repetido].sort_index()
+    ultima = dataframe.groupby(CHAVE_GASTO, observed=True, dropna=False)['_sequencia'].transform('max')
+    return dataframe[dataframe['_sequencia'] == ultima]
+
+
+def alinhar_dimensoes(df_hubspot, df_gasto):
+    # Dá às dimensões dos dois arquivos o mesmo dicionário de categorias, para que
+    # filtros e merges entre eles comparem códigos inteiros
+    novas_hubspot, novas_gasto = {}, {}
+    for coluna_hubspot, coluna_gasto in DIMENSOES_COMPARTILHADAS:
+        a, b = df_hubspot[coluna_hubspot], df_gasto[coluna_gasto]
+        if not (isinstance(a.dtype, pd.CategoricalDtype) and isinstance(b.dtype, pd.CategoricalDtype)):
+            continue
+        if a.cat.categories.equals(b.cat.categories):
+            continue
+        categorias = a.cat.categories.union(b.cat.categories)
+        novas_hubspot[coluna_hubspot] = a.cat.set_categories(categorias)
+        novas_gasto[coluna_gasto] = b.cat.set_categories(categorias)
+    # assign devolve novos frames: os originais ficam intactos no cache de ingestão
+    return df_hubspot.assign(**novas_hubspot), df_gasto.assign(**novas_gasto)
+
+
+def tratar_arquivo_hubspot(dataframe):
+    # Tratamento de dados
+    dataframe.columns = dataframe.columns.map(MAPA_COLUNAS)
+
+    # Colunas categóricas: cada regra roda só sobre os valores distintos
+    dataframe['motivo_fechamento_agrupado'] = mapear_unicos(dataframe['motivo_fechamento'], agrupar_motivo)
+    dataframe['convenio_acronimo'] = mapear_unicos(dataframe['convenio'], criar_acronimo)
+    dataframe['equipe'] = mapear_unicos(dataframe['equipe'], normalizar_equipe)
+
+    # Datas ficam em datetime64 (dia) e o horário em timedelta64, sem objetos Python por linha
+    # Cada string de data distinta é analisada uma vez só (cache compartilhado entre colunas e arquivos)
+    data_criado = parser_hubspot.converter(dataframe['data_criado'])
+    dataframe['data'] = data_criado.dt.normalize()
+    dataframe['horario_criado'] = data_criado - dataframe['data']
+    dataframe.drop(columns=['data_criado'], inplace=True)
+
+    for coluna in COLUNAS_DATA_ETAPA:
+        if coluna in dataframe.columns:
+            dataframe[coluna] = parser_hubspot.converter(dataframe[coluna]).dt.normalize()
+
+    # Cliente pelo CPF e pelo telefone (duplicados.py) e a posição do CPF no esboço de
+    # distintos (distintos.registros)
+    for coluna, normalizar in [('cpf', normalizar_cpf), ('telefone', normalizar_telefone)]:
+        if coluna in dataframe.columns:
+            dataframe[coluna] = normalizar(dataframe[coluna])
+        else:
+            dataframe[coluna] = pd.Series(pd.NA, index=dataframe.index, dtype='Int64')
+    dataframe['registro_cpf'], dataframe['posto_cpf'] = registros(dataframe['cpf'])
+
+    if config.DIMENSOES_CATEGORICAS:
+        converter_dimensoes(dataframe, COLUNAS_DIMENSAO)
+    return dataframe
+
+
+def tratar_arquivo_pagos(dataframe):
+    dataframe['data'] = parser_gasto.converter(dataframe['Data']).dt.normalize()
+    dataframe['Valor Gasto'] = (dataframe['Canal'].map(PRECO_CANAL) * dataframe['Quantidade']).round(2)
+    if config.DIMENSOES_CATEGORICAS:
+        converter_dimensoes(dataframe, COLUNAS_DIMENSAO_GASTO)
+    return dataframe